@@ -0,0 +1,50 @@
+"""denormalized_counters
+
+Revision ID: 12cb93bf8272
+Revises: 4d31c7b7a2b9
+Create Date: 2026-10-18 12:35:50.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '12cb93bf8272'
+down_revision = '4d31c7b7a2b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tweet', sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user', sa.Column('follower_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user', sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(
+        """
+        UPDATE tweet SET like_count = f.cnt
+        FROM (SELECT tweet_id, count(*) AS cnt FROM favorite GROUP BY tweet_id) AS f
+        WHERE f.tweet_id = tweet.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE "user" SET follower_count = uf.cnt
+        FROM (SELECT following_id, count(*) AS cnt FROM user_following GROUP BY following_id) AS uf
+        WHERE uf.following_id = "user".id
+        """
+    )
+    op.execute(
+        """
+        UPDATE "user" SET following_count = uf.cnt
+        FROM (SELECT user_id, count(*) AS cnt FROM user_following GROUP BY user_id) AS uf
+        WHERE uf.user_id = "user".id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'following_count')
+    op.drop_column('user', 'follower_count')
+    op.drop_column('tweet', 'like_count')
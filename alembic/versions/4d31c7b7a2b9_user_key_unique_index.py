@@ -0,0 +1,39 @@
+"""user_key_unique_index
+
+Revision ID: 4d31c7b7a2b9
+Revises: 5dc91bcf2070
+Create Date: 2026-10-18 11:48:05.317642
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d31c7b7a2b9'
+down_revision = '5dc91bcf2070'
+branch_labels = None
+depends_on = None
+
+
+# Индекс строится CONCURRENTLY, без блокировки записи, поэтому вне транзакции миграции.
+# Прерванная или неудачная сборка оставляет индекс INVALID - он удаляется перед новой попыткой.
+# Повторяющиеся ключи проверяются заранее: с ними уникальный индекс не построится.
+
+def upgrade() -> None:
+    duplicates = op.get_bind().execute(
+        sa.text('SELECT count(*) FROM (SELECT key FROM "user" GROUP BY key HAVING count(*) > 1) AS duplicate')
+    ).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f'{duplicates} API keys are shared by several users; make user.key unique before creating ix_user_key'
+        )
+
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_user_key')
+        op.create_index(op.f('ix_user_key'), 'user', ['key'], unique=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_user_key'), table_name='user', postgresql_concurrently=True)
@@ -0,0 +1,40 @@
+"""timeline
+
+Revision ID: 5dc91bcf2070
+Revises: d77d5576db81
+Create Date: 2026-10-18 11:03:27.554190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5dc91bcf2070'
+down_revision = 'd77d5576db81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('timeline',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('tweet_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['tweet_id'], ['tweet.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'tweet_id')
+    )
+    op.create_index(
+        'ix_timeline_user_id_created_at_tweet_id',
+        'timeline',
+        ['user_id', sa.text('created_at DESC'), sa.text('tweet_id DESC')],
+        unique=False,
+    )
+    op.create_index('ix_timeline_tweet_id', 'timeline', ['tweet_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_timeline_tweet_id', table_name='timeline')
+    op.drop_index('ix_timeline_user_id_created_at_tweet_id', table_name='timeline')
+    op.drop_table('timeline')
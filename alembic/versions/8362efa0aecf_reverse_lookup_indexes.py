@@ -0,0 +1,52 @@
+"""reverse_lookup_indexes
+
+Revision ID: 8362efa0aecf
+Revises: 88fd583eca41
+Create Date: 2026-10-18 14:02:37.512904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8362efa0aecf'
+down_revision = '88fd583eca41'
+branch_labels = None
+depends_on = None
+
+
+# Первичные ключи (user_id, tweet_id) и (user_id, following_id) не помогают при поиске
+# по второй колонке: лайки твита и подписчики пользователя читались полным сканированием.
+# Индекс по follower_count нужен ленте в режиме push: авторы выше порога раздачи
+# находятся диапазонным чтением, а не перебором всех пользователей.
+# Индексы строятся CONCURRENTLY, без блокировки записи, поэтому вне транзакции миграции.
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_favorite_tweet_id_user_id', 'favorite', ['tweet_id', 'user_id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_user_following_following_id_user_id', 'user_following', ['following_id', 'user_id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_tweet_media_media_id', 'tweet_media', ['media_id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_user_follower_count', 'user', ['follower_count'],
+            unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_follower_count', table_name='user', postgresql_concurrently=True)
+        op.drop_index('ix_tweet_media_media_id', table_name='tweet_media', postgresql_concurrently=True)
+        op.drop_index(
+            'ix_user_following_following_id_user_id', table_name='user_following', postgresql_concurrently=True
+        )
+        op.drop_index('ix_favorite_tweet_id_user_id', table_name='favorite', postgresql_concurrently=True)
@@ -0,0 +1,24 @@
+"""user_graph_version
+
+Revision ID: 839be2a6e111
+Revises: ebe1be211c53
+Create Date: 2026-10-18 21:02:47.195310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '839be2a6e111'
+down_revision = 'ebe1be211c53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('graph_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'graph_version')
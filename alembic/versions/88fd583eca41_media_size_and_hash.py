@@ -0,0 +1,28 @@
+"""media_size_and_hash
+
+Revision ID: 88fd583eca41
+Revises: 12cb93bf8272
+Create Date: 2026-10-18 13:20:14.671835
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '88fd583eca41'
+down_revision = '12cb93bf8272'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('media', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('media', sa.Column('sha256', sa.Text(), nullable=True))
+    op.create_index(op.f('ix_media_sha256'), 'media', ['sha256'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_media_sha256'), table_name='media')
+    op.drop_column('media', 'sha256')
+    op.drop_column('media', 'size')
@@ -0,0 +1,47 @@
+"""tweet_cascade_deletes
+
+Revision ID: c02887daacf7
+Revises: 8362efa0aecf
+Create Date: 2026-10-18 15:10:52.884120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c02887daacf7'
+down_revision = '8362efa0aecf'
+branch_labels = None
+depends_on = None
+
+
+# Лайки и вложения удаляются вместе с твитом самой БД. Замена ключа берёт ACCESS EXCLUSIVE
+# на favorite и tweet_media, поэтому новые ключи создаются NOT VALID (без проверки строк)
+# и фиксируются сразу; проверка существующих строк (VALIDATE) выполняется отдельно,
+# вне транзакции миграции, и блокирует только изменение схемы, но не запись.
+FOREIGN_KEYS = (
+    ('favorite_tweet_id_fkey', 'favorite'),
+    ('tweet_media_tweet_id_fkey', 'tweet_media'),
+)
+
+
+def _replace_foreign_keys(on_delete: str) -> None:
+    for name, table in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+        op.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY (tweet_id) REFERENCES tweet (id) '
+            f'ON DELETE {on_delete} NOT VALID'
+        )
+    # autocommit_block фиксирует замену ключей, освобождая ACCESS EXCLUSIVE до долгой проверки
+    with op.get_context().autocommit_block():
+        for name, table in FOREIGN_KEYS:
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}')
+
+
+def upgrade() -> None:
+    _replace_foreign_keys('CASCADE')
+
+
+def downgrade() -> None:
+    _replace_foreign_keys('NO ACTION')
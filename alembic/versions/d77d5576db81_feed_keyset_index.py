@@ -0,0 +1,37 @@
+"""feed_keyset_index
+
+Revision ID: d77d5576db81
+Revises: 3dd73f1f421f
+Create Date: 2026-10-18 10:12:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd77d5576db81'
+down_revision = '3dd73f1f421f'
+branch_labels = None
+depends_on = None
+
+
+# tweet - самая нагружаемая записью таблица: индекс строится CONCURRENTLY, без блокировки
+# записи, поэтому вне транзакции миграции. Индекс, оставшийся INVALID после прерванной
+# сборки, удаляется перед новой попыткой.
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_tweet_user_id_created_at_id')
+        op.create_index(
+            'ix_tweet_user_id_created_at_id',
+            'tweet',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tweet_user_id_created_at_id', table_name='tweet', postgresql_concurrently=True)
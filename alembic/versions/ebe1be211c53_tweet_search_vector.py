@@ -0,0 +1,44 @@
+"""tweet_search_vector
+
+Revision ID: ebe1be211c53
+Revises: facf796cf378
+Create Date: 2026-10-18 19:40:12.318544
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'ebe1be211c53'
+down_revision = 'facf796cf378'
+branch_labels = None
+depends_on = None
+
+
+# Генерируемая колонка переписывает таблицу tweet под исключительной блокировкой:
+# на больших инсталляциях миграцию стоит запускать в окно обслуживания.
+# GIN-индекс строится CONCURRENTLY, без блокировки записи, поэтому вне транзакции миграции.
+
+def upgrade() -> None:
+    op.add_column(
+        'tweet',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('simple'::regconfig, coalesce(post, ''))", persisted=True),
+            nullable=True,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_tweet_search_vector', 'tweet', ['search_vector'],
+            unique=False, postgresql_using='gin', postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tweet_search_vector', table_name='tweet', postgresql_concurrently=True)
+    op.drop_column('tweet', 'search_vector')
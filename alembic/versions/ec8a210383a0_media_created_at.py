@@ -0,0 +1,28 @@
+"""media_created_at
+
+Revision ID: ec8a210383a0
+Revises: c02887daacf7
+Create Date: 2026-10-18 15:47:21.306518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ec8a210383a0'
+down_revision = 'c02887daacf7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Существующие медиа получают время миграции: период ожидания сборщика отсчитывается от него
+    op.add_column(
+        'media',
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('media', 'created_at')
@@ -0,0 +1,36 @@
+"""media_variants
+
+Revision ID: facf796cf378
+Revises: ec8a210383a0
+Create Date: 2026-10-18 16:31:08.455172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'facf796cf378'
+down_revision = 'ec8a210383a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('media', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('variant', sa.Text(), nullable=True))
+    op.add_column('media', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('height', sa.Integer(), nullable=True))
+    op.create_foreign_key('media_parent_id_fkey', 'media', 'media', ['parent_id'], ['id'], ondelete='CASCADE')
+    op.create_index(op.f('ix_media_parent_id'), 'media', ['parent_id'], unique=False)
+    op.create_unique_constraint('media_parent_id_variant_key', 'media', ['parent_id', 'variant'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('media_parent_id_variant_key', 'media', type_='unique')
+    op.drop_index(op.f('ix_media_parent_id'), table_name='media')
+    op.drop_constraint('media_parent_id_fkey', 'media', type_='foreignkey')
+    op.drop_column('media', 'height')
+    op.drop_column('media', 'width')
+    op.drop_column('media', 'variant')
+    op.drop_column('media', 'parent_id')
@@ -0,0 +1,173 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from app import metrics
+from app.config import settings
+
+
+class TTLCache:
+    """
+    Внутрипроцессный LRU-кэш с ограничением времени жизни записей.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict()
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+api_key_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+# Неизвестные ключи - отдельно: перебор случайных ключей не вытесняет известные
+unknown_key_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_UNKNOWN_CACHE_TTL)
+
+
+class LocalCacheBackend:
+    """
+    Бэкенд кэша ответов в памяти процесса (LRU + TTL).
+    """
+
+    def __init__(self, maxsize: int, name: str = "response"):
+        evictions = metrics.CACHE_EVICTIONS.labels(name)
+        self._cache = TTLCache(maxsize=maxsize, ttl=0, on_evict=evictions.inc)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._cache.set(key, value, ttl)
+
+
+class RedisCacheBackend:
+    """
+    Бэкенд кэша ответов поверх Redis-совместимого клиента (redis.asyncio.Redis
+    или любой объект с асинхронными get/set(key, value, ex=...)).
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' extra to be installed")
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._client.set(key, value, ex=max(int(ttl), 1))
+
+
+class ResponseCache:
+    """
+    Кэш отрендеренных ответов с ключами, версионированными по пользователю.
+
+    Запись пользователя (твит, лайк, подписка) меняет его версию, и все ранее
+    сохранённые ключи с его участием перестают находиться. Версия - случайный
+    токен, а не счётчик: вытеснение ключа версии не может вернуть старые записи.
+    """
+
+    version_ttl = 24 * 60 * 60
+
+    def __init__(self, backend, name: str = "response"):
+        self.backend = backend
+        self.name = name
+
+    async def version(self, user_id: int) -> str:
+        key = f"v:user:{user_id}"
+        version = await self.backend.get(key)
+        if version is None:
+            version = uuid.uuid4().hex.encode()
+            await self.backend.set(key, version, self.version_ttl)
+        return version.decode() if isinstance(version, bytes) else version
+
+    async def invalidate(self, *user_ids: int) -> None:
+        for user_id in user_ids:
+            await self.backend.set(f"v:user:{user_id}", uuid.uuid4().hex.encode(), self.version_ttl)
+
+    async def key(self, namespace: str, user_id: int, *parts) -> str:
+        return ":".join([namespace, str(user_id), await self.version(user_id), *map(str, parts)])
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = await self.backend.get(key)
+        if value is None:
+            metrics.CACHE_MISSES.labels(self.name).inc()
+        else:
+            metrics.CACHE_HITS.labels(self.name).inc()
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.backend.set(key, value, ttl)
+
+    async def get_tagged(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Ответ вместе с его ETag. Тело и ETag хранятся одной записью, поэтому всегда согласованы.
+        """
+
+        value = await self.get(key)
+        if value is None or not value.startswith(b'W/"'):
+            return None
+        etag, _, body = value.partition(b"\n")
+        return etag.decode(), body
+
+    async def set_tagged(self, key: str, etag: str, body: bytes, ttl: float) -> None:
+        await self.set(key, etag.encode() + b"\n" + body, ttl)
+
+
+class NullCacheBackend:
+    """
+    Отключённый кэш: ничего не хранит.
+    """
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        pass
+
+
+def create_response_cache() -> ResponseCache:
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        return ResponseCache(RedisCacheBackend.from_url(settings.REDIS_URL))
+    if settings.RESPONSE_CACHE_BACKEND == "local":
+        return ResponseCache(LocalCacheBackend(settings.RESPONSE_CACHE_SIZE))
+    return ResponseCache(NullCacheBackend())
+
+
+response_cache = create_response_cache()
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
 
 from pydantic import BaseSettings, PostgresDsn, validator, EmailStr, DirectoryPath, HttpUrl
 
@@ -11,14 +11,157 @@ class Settings(BaseSettings):
 
     SQLALCHEMY_DATABASE_URI: Optional[PostgresDsn] = None
 
+    # Итоговое число соединений с БД: (DB_POOL_SIZE + DB_MAX_OVERFLOW) * число воркеров
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = False
+    # Сколько соединений каждого пула открыть при старте воркера, до первого запроса
+    DB_POOL_PREFILL: int = 2
+    # 0 отключает кэши подготовленных выражений (например, за pgbouncer в режиме transaction)
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+
+    # Реплики для читающих endpoint'ов (JSON-список DSN); пустой список - всё идёт в основную БД
+    SQLALCHEMY_REPLICA_URIS: List[PostgresDsn] = []
+    DB_REPLICA_SELECTION: Literal["round_robin", "least_busy"] = "round_robin"
+    DB_REPLICA_HEALTH_CHECK_INTERVAL: float = 5
+    DB_REPLICA_HEALTH_CHECK_TIMEOUT: float = 2
+    # Сколько секунд после записи клиент читает из основной БД (read-your-writes)
+    DB_READ_YOUR_WRITES_WINDOW: int = 5
+
     PGADMIN_DEFAULT_EMAIL: EmailStr
     PGADMIN_DEFAULT_PASSWORD: str
     PGADMIN_LISTEN_ADDRESS: str
     PGADMIN_LISTEN_PORT: str
 
+    # Каталог медиа (при MEDIA_STORAGE=s3 - только для временных файлов загрузки и старых медиа)
     OUT_FILE_PATH: DirectoryPath
+    MEDIA_STORAGE: Literal["local", "s3"] = "local"
+    S3_BUCKET: Optional[str] = None
+    S3_PREFIX: str = ""
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_PRESIGN_EXPIRES: int = 60 * 60
+    MEDIA_MAX_SIZE: int = 10 * 1024 * 1024
+    MEDIA_CHUNK_SIZE: int = 64 * 1024
+    MEDIA_CACHE_MAX_AGE: int = 365 * 24 * 60 * 60
+    # Типы, которые браузер показывает сам (Content-Disposition: inline); остальные файлы,
+    # в том числе html и svg, отдаются как application/octet-stream для скачивания
+    MEDIA_INLINE_TYPES: Set[str] = {
+        "image/jpeg", "image/png", "image/gif", "image/webp", "image/avif", "video/mp4", "video/webm",
+    }
+    MEDIA_GC_QUEUE_SIZE: int = 1000
+    # Периодическая сборка медиа без ссылок; 0 - отключена
+    MEDIA_GC_INTERVAL: float = 60 * 60
+    # Медиа моложе периода ожидания не трогаются: их ещё могут прикрепить к твиту
+    MEDIA_GC_GRACE_PERIOD: float = 24 * 60 * 60
+    MEDIA_GC_BATCH_SIZE: int = 100
+    MEDIA_GC_MAX_FILES_PER_SECOND: float = 50
+    # Уменьшенные копии изображений: вариант -> наибольшая сторона в пикселях
+    MEDIA_VARIANTS: Dict[str, int] = {"thumbnail": 320, "medium": 1280}
+    MEDIA_VARIANT_JPEG_QUALITY: int = 85
+    MEDIA_VARIANT_PROCESSES: int = 2
+    MEDIA_VARIANT_WORKERS: int = 2
+    MEDIA_VARIANT_QUEUE_SIZE: int = 1000
+
+    # Без DSN Sentry не подключается
+    SENTRY_DSN: Optional[HttpUrl] = None
+    SENTRY_ENVIRONMENT: Optional[str] = None
+    # Доля запросов с трассировкой производительности и профилированием
+    SENTRY_TRACES_SAMPLE_RATE: float = 0.05
+    SENTRY_PROFILES_SAMPLE_RATE: float = 0
+
+    # Производственный сервер: gunicorn с воркерами uvicorn (gunicorn_conf.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 80
+    # По умолчанию - по числу ядер
+    SERVER_WORKERS: Optional[int] = None
+    # Импорт приложения один раз в мастер-процессе до fork: воркеры стартуют быстрее
+    SERVER_PRELOAD: bool = True
+    # Сколько воркер дозавершает текущие запросы после SIGTERM
+    SERVER_GRACEFUL_TIMEOUT: int = 30
+    SERVER_TIMEOUT: int = 60
+    SERVER_KEEPALIVE: int = 5
+    # Перезапуск воркера после N запросов (0 - не перезапускать), с разбросом, чтобы не все разом
+    SERVER_MAX_REQUESTS: int = 0
+    SERVER_MAX_REQUESTS_JITTER: int = 0
+
+    FEED_PAGE_SIZE: int = 50
+    FEED_MAX_PAGE_SIZE: int = 200
+    SEARCH_QUERY_MAX_LENGTH: int = 256
+    # Наибольшее число id в одном запросе batch-endpoint'ов
+    BATCH_MAX_SIZE: int = 100
+    # Ширина, под которую в ленте подбирается наименьшая подходящая копия вложения
+    FEED_MEDIA_WIDTH: int = 640
+    # Проверять ответы быстрых путей сериализации схемой (для отладки)
+    VALIDATE_RESPONSES: bool = False
+
+    # pull - лента собирается при чтении, push - раздаётся подписчикам при публикации
+    TIMELINE_MODE: Literal["pull", "push"] = "pull"
+    TIMELINE_FANOUT_MAX_FOLLOWERS: int = 10000
+    TIMELINE_FANOUT_WORKERS: int = 2
+    TIMELINE_FANOUT_QUEUE_SIZE: int = 1000
+    TIMELINE_BACKFILL_LIMIT: int = 200
+
+    # local - события доходят только до клиентов этого процесса, postgres - до всех воркеров (LISTEN/NOTIFY)
+    REALTIME_BROKER: Literal["local", "postgres"] = "local"
+    REALTIME_CHANNEL: str = "realtime_events"
+    REALTIME_QUEUE_SIZE: int = 256
+    # События, ожидающие отправки в брокер postgres; при переполнении новые отбрасываются
+    REALTIME_PUBLISH_QUEUE_SIZE: int = 1000
+    # Пустое событие для поддержания соединения, если других событий не было
+    REALTIME_HEARTBEAT: float = 15
+    REALTIME_RECONNECT_DELAY: float = 1
+
+    # Кэш в памяти воркера: смена или удаление ключа сбрасывает его только в воркере,
+    # выполнившем запись, в остальных старый ключ действует до AUTH_CACHE_TTL
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL: float = 60
+    # Сколько неизвестный ключ отклоняется без запроса к БД; созданный за это время в другом
+    # воркере пользователь не сможет войти через этот воркер до истечения срока
+    AUTH_UNKNOWN_CACHE_TTL: float = 5
+
+    # local - LRU в памяти процесса, redis - общий для всех воркеров, none - отключён.
+    # local сбрасывается только в своём процессе, поэтому gunicorn_conf.py при нескольких
+    # воркерах заменяет его на none
+    RESPONSE_CACHE_BACKEND: Literal["none", "local", "redis"] = "local"
+    RESPONSE_CACHE_SIZE: int = 10000
+    REDIS_URL: Optional[str] = None
+    PROFILE_CACHE_TTL: float = 60
+    # Чужие твиты и лайки попадают в закэшированную ленту не позже, чем через FEED_CACHE_TTL
+    FEED_CACHE_TTL: float = 5
+
+    # Ограничение частоты запросов клиента (ключ API, без ключа - IP) к маршруту /api/...:
+    # local - в памяти, отдельно в каждом воркере, redis - общее для всех воркеров, none - отключено
+    RATE_LIMIT_BACKEND: Literal["none", "local", "redis"] = "local"
+    # Запросов в секунду и допустимый всплеск по умолчанию
+    RATE_LIMIT_RATE: float = 20
+    RATE_LIMIT_BURST: int = 40
+    # Лимиты отдельных маршрутов: "МЕТОД шаблон" -> (запросов в секунду, всплеск)
+    RATE_LIMIT_ROUTES: Dict[str, Tuple[float, int]] = {
+        "GET /api/tweets": (5, 20),
+        "GET /api/tweets/search": (2, 10),
+        "POST /api/tweets": (2, 10),
+        "POST /api/medias": (1, 10),
+    }
+    RATE_LIMIT_LOCAL_SIZE: int = 100000
+
+    # Запросов одновременно в обработке у воркера; 0 - DB_POOL_SIZE + DB_MAX_OVERFLOW
+    ADMISSION_MAX_CONCURRENCY: int = 0
+    # Сколько запросов и как долго ждут свободного места, прежде чем получить 503
+    ADMISSION_QUEUE_SIZE: int = 100
+    ADMISSION_QUEUE_TIMEOUT: float = 1
+    ADMISSION_RETRY_AFTER: int = 1
+    ADMISSION_EXEMPT_ROUTES: List[str] = ["GET /api/stream", "GET /metrics"]
 
-    SENTRY_DSN: HttpUrl
+    # Запросы дольше порога (в секундах) пишутся в лог; 0 - отключено
+    DB_SLOW_QUERY_THRESHOLD: float = 0.5
+    # Заголовок Server-Timing с числом и временем запросов к БД в каждом ответе
+    SERVER_TIMING: bool = False
 
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def assemble_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
@@ -0,0 +1,59 @@
+from sqlalchemy import and_, case, exists, func, or_, select, update
+from sqlalchemy.sql import Select, Update
+
+from app import models
+
+
+def like_count_delta(tweet_id: int, delta: int) -> Update:
+    """
+    Атомарное изменение счётчика отметок "Нравится" твита. Заодно обновляется
+    updated_at: от него зависит ETag страниц ленты с этим твитом.
+    """
+
+    return (
+        update(models.Tweet)
+        .where(models.Tweet.id == tweet_id)
+        .values(like_count=models.Tweet.like_count + delta, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def follow_counts_delta(user_id: int, following_id: int, delta: int) -> Update:
+    """
+    Атомарное изменение счётчиков подписок и подписчиков одним UPDATE по обоим пользователям
+    (вместе с их graph_version).
+    """
+
+    user = models.User
+    return (
+        update(user)
+        .where(user.id.in_([user_id, following_id]))
+        .values(
+            following_count=user.following_count + case((user.id == user_id, delta), else_=0),
+            follower_count=user.follower_count + case((user.id == following_id, delta), else_=0),
+            graph_version=user.graph_version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def follow_counts_batch_delta(user_id: int, following_ids: Select, delta: int) -> Update:
+    """
+    Изменение счётчиков при подписке пользователя сразу на несколько пользователей
+    (following_ids - подзапрос с их id) одним UPDATE: у подписчика счётчик меняется
+    на число подписок, у каждого из пользователей - на delta.
+    """
+
+    user = models.User
+    followed = following_ids.scalar_subquery()
+    followed_count = select(func.count()).select_from(following_ids.subquery()).scalar_subquery()
+    return (
+        update(user)
+        .where(or_(user.id.in_(followed), and_(user.id == user_id, exists(following_ids))))
+        .values(
+            following_count=user.following_count + case((user.id == user_id, delta * followed_count), else_=0),
+            follower_count=user.follower_count + case((user.id.in_(followed), delta), else_=0),
+            graph_version=user.graph_version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
@@ -1,8 +1,149 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import List, Optional
+
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from app import metrics
 from app.config import settings
 
 
-engine = create_async_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, замеряющий время ожидания свободного соединения.
+
+    Заполненность пула выставляется в метрики при каждой выдаче и возврате соединения,
+    а не вычисляется при сборе: в режиме нескольких воркеров gunicorn prometheus_client
+    читает значения из файлов процессов, функции-гейджи там не поддерживаются.
+    """
+
+    metrics_label = "primary"
+
+    def publish_metrics(self) -> None:
+        metrics.DB_POOL_CHECKED_OUT.labels(self.metrics_label).set(self.checkedout())
+        metrics.DB_POOL_OVERFLOW.labels(self.metrics_label).set(max(self.overflow(), 0))
+        metrics.DB_POOL_SIZE.labels(self.metrics_label).set(self.size())
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT_SECONDS.labels(self.metrics_label).observe(time.perf_counter() - started)
+            self.publish_metrics()
+
+    def _do_return_conn(self, conn):
+        try:
+            super()._do_return_conn(conn)
+        finally:
+            self.publish_metrics()
+
+
+def create_engine(url: str, label: str) -> AsyncEngine:
+    """
+    Создание движка с настройками пула и кэша подготовленных выражений из Settings.
+    """
+
+    pool_class = type(f"{label.title()}QueuePool", (InstrumentedQueuePool,), {"metrics_label": label})
+    new_engine = create_async_engine(
+        url,
+        poolclass=pool_class,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        },
+    )
+
+    new_engine.sync_engine.pool.publish_metrics()
+    return new_engine
+
+
+engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, "primary")
 async_session = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def prefill_pool(pool_engine: AsyncEngine, connections: int) -> None:
+    """
+    Открытие `connections` соединений пула заранее: первые запросы не ждут установки
+    соединения и аутентификации в Postgres.
+    """
+
+    if connections <= 0:
+        return
+
+    opened = await asyncio.gather(*(pool_engine.connect() for _ in range(connections)))
+    try:
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in opened))
+    finally:
+        await asyncio.gather(*(conn.close() for conn in opened))
+
+
+class ReplicaRouter:
+    """
+    Выбор реплики для читающих запросов (round-robin или наименее загруженная).
+
+    Реплики периодически проверяются `SELECT 1`; недоступные исключаются из выбора,
+    а при отсутствии доступных реплик чтение идёт в основную БД.
+    """
+
+    def __init__(self, urls: List[str], strategy: str):
+        self.engines = [create_engine(url, f"replica{i}") for i, url in enumerate(urls)]
+        self.healthy = {replica: True for replica in self.engines}
+        self.strategy = strategy
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def choose(self) -> AsyncEngine:
+        candidates = [replica for replica in self.engines if self.healthy[replica]]
+        if not candidates:
+            return engine
+
+        if self.strategy == "least_busy":
+            return min(candidates, key=lambda replica: replica.sync_engine.pool.checkedout())
+        return candidates[next(self._counter) % len(candidates)]
+
+    async def check_health(self) -> None:
+        for replica in self.engines:
+            try:
+                async with replica.connect() as conn:
+                    await asyncio.wait_for(
+                        conn.execute(text("SELECT 1")), timeout=settings.DB_REPLICA_HEALTH_CHECK_TIMEOUT
+                    )
+            except Exception:
+                if self.healthy[replica]:
+                    logger.warning("replica %s is unavailable, reads fall back", replica.url)
+                self.healthy[replica] = False
+            else:
+                self.healthy[replica] = True
+
+    async def start(self) -> None:
+        if self.engines:
+            await self.check_health()
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.DB_REPLICA_HEALTH_CHECK_INTERVAL)
+            await self.check_health()
+
+
+replicas = ReplicaRouter(settings.SQLALCHEMY_REPLICA_URIS, settings.DB_REPLICA_SELECTION)
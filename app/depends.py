@@ -1,98 +1,164 @@
-from db.session import async_session
-from fastapi import Path, Header, Depends, HTTPException
+import time
+from typing import NamedTuple, Optional
+
+from fastapi import Header, Depends, HTTPException, Response
+from sqlalchemy import event, inspect
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
+from starlette.requests import HTTPConnection
 
 from app import models
+from app.cache import api_key_cache, unknown_key_cache
+from app.config import settings
+from app.db.session import async_session, replicas
 
 
-async def get_session() -> AsyncSession:
+async def get_session(connection: HTTPConnection) -> AsyncSession:
     """
     Создание объекта сессии.
+
+    Сессия одна на запрос: её получают все зависимости (get_crt_user, get_read_session, ...)
+    и сам обработчик; соединение из пула берётся только при первом обращении к БД.
     """
 
+    session = getattr(connection.state, "db_session", None)
+    if session is not None:
+        yield session
+        return
+
     async with async_session() as session:
+        connection.state.db_session = session
+        try:
+            yield session
+        finally:
+            del connection.state.db_session
+
+
+PRIMARY_READS_COOKIE = "db_primary_until"
+
+
+async def get_read_session(
+        connection: HTTPConnection,
+        session: AsyncSession = Depends(get_session)
+) -> AsyncSession:
+    """
+    Сессия для читающих endpoint'ов.
+
+    При настроенных репликах чтение идёт в одну из них, кроме случая, когда
+    клиент недавно выполнял запись (cookie от track_writes): тогда используется
+    основная сессия запроса, чтобы клиент увидел собственные изменения.
+    """
+
+    if not replicas.engines or _reads_own_writes(connection):
         yield session
+        return
+
+    async with async_session(bind=replicas.choose()) as read_session:
+        yield read_session
+
+
+async def track_writes(connection: HTTPConnection, response: Response) -> None:
+    """
+    Пометка клиента, выполнившего запись: ближайшие чтения пойдут в основную БД.
+    """
+
+    if replicas.engines and connection.scope.get("method") not in ("GET", "HEAD", "OPTIONS"):
+        window = settings.DB_READ_YOUR_WRITES_WINDOW
+        response.set_cookie(PRIMARY_READS_COOKIE, str(int(time.time()) + window), max_age=window, httponly=True)
+
+
+def _reads_own_writes(connection: HTTPConnection) -> bool:
+    try:
+        return float(connection.cookies.get(PRIMARY_READS_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
 
 
 async def get_crt_user(
         api_key: str = Header(default=None, alias="api-key"),
         session: AsyncSession = Depends(get_session)
-):
+) -> CurrentUser:
     """
     Аутентификация текущего пользователя.
+
+    Ключ разрешается в пару (id, username) через кэш; при промахе выполняется
+    один запрос по уникальному индексу user.key.
     """
 
-    stmt = select(models.User).filter_by(key=api_key).options(
-        selectinload(models.User.following),
-        selectinload(models.User.followers),
-        selectinload(models.User.tweets),
-    )
-    res = await session.execute(stmt)
-    user = res.scalars().one_or_none()
-    print(user)
-    if user:
-        return user
-    else:
+    user = await resolve_api_key(session, api_key)
+    if user is None:
         raise HTTPException(status_code=401, detail='Unauthorized')
+    return user
 
 
-async def get_crt_tweet(
-    tweet_id: int = Path(alias="id"),
-    session: AsyncSession = Depends(get_session),
-):
+async def resolve_api_key(session: AsyncSession, api_key: Optional[str]) -> Optional[CurrentUser]:
     """
-    Валидация наличия указанного твита.
+    Пользователь по ключу API или None, если ключ не задан или неизвестен.
     """
 
-    stmt = select(models.Tweet).filter_by(id=tweet_id)
-    res = await session.execute(stmt)
-    tweet = res.scalars().one_or_none()
+    if api_key is None:
+        return None
 
-    if tweet:
-        return tweet
-    else:
-        raise HTTPException(status_code=404, detail="Tweet not found")
+    user = api_key_cache.get(api_key)
+    if user is None:
+        if unknown_key_cache.get(api_key):
+            return None
 
+        stmt = select(models.User.id, models.User.username).filter_by(key=api_key)
+        res = await session.execute(stmt)
+        row = res.one_or_none()
+        if row is None:
+            unknown_key_cache.set(api_key, True)
+            return None
 
-async def get_crt_favorite(
-        tweet_id: int = Path(alias="id"),
-        user: models.User = Depends(get_crt_user),
-        session: AsyncSession = Depends(get_session)
-):
+        user = CurrentUser(*row)
+        api_key_cache.set(api_key, user)
+
+    return user
+
+
+async def load_user_profile(session: AsyncSession, user_id: int, counts: bool = False) -> Optional[models.User]:
     """
-    Валидация наличия указанной отметки "Нравится".
+    Загрузка профиля пользователя вместе с подписками и подписчиками
+    (только счётчики при `counts=true`).
+
+    Вызывается из обработчиков после промаха кэша ответов, поэтому не является зависимостью.
     """
 
-    stmt = select(models.Favorite).filter_by(user_id=user.id, tweet_id=tweet_id)
+    stmt = select(models.User).filter_by(id=user_id)
+    if not counts:
+        stmt = stmt.options(selectinload(models.User.following), selectinload(models.User.followers))
     res = await session.execute(stmt)
-    favorite = res.scalars().one_or_none()
-
-    if favorite:
-        return favorite
-    else:
-        raise HTTPException(status_code=404, detail="Like not found")
+    return res.scalars().one_or_none()
 
 
-async def get_user_by_id(
-        user_id: int = Path(alias="id"),
-        session: AsyncSession = Depends(get_session)
-):
+def invalidate_api_key(api_key: str) -> None:
     """
-    Валидация наличия указанного пользователя.
+    Сброс закэшированной аутентификации по ключу в текущем процессе; другие воркеры
+    принимают старый ключ, пока не истечёт AUTH_CACHE_TTL.
     """
 
-    stmt = select(models.User).filter_by(id=user_id).options(
-        selectinload(models.User.following),
-        selectinload(models.User.followers),
-        selectinload(models.User.tweets),
-    )
-    res = await session.execute(stmt)
-    user = res.scalars().one_or_none()
+    api_key_cache.pop(api_key)
+    unknown_key_cache.pop(api_key)
+
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_updated_user_key(mapper, connection, target):
+    for api_key in (*inspect(target).attrs.key.history.deleted, target.key):
+        invalidate_api_key(api_key)
+
+
+@event.listens_for(models.User, "after_insert")
+def _invalidate_new_user_key(mapper, connection, target):
+    invalidate_api_key(target.key)
 
-    if user:
-        return user
-    else:
-        raise HTTPException(status_code=404, detail='User not found')
 
+@event.listens_for(models.User, "after_delete")
+def _invalidate_deleted_user_key(mapper, connection, target):
+    invalidate_api_key(target.key)
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from app.db.session import async_session
+
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[..., Awaitable[None]]
+
+
+class BackgroundWorker:
+    """
+    Ограниченный пул фоновых asyncio-задач (раздача твитов по лентам, очистка медиа).
+
+    Каждое задание выполняется в собственной сессии, которая фиксируется после него.
+    Очередь ограничена: при её заполнении `submit` ожидает освобождения места,
+    притормаживая пишущие запросы вместо неограниченного роста памяти.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job: Job, *args) -> None:
+        await self.queue.put((job, args))
+
+    async def _worker(self) -> None:
+        while True:
+            job, args = await self.queue.get()
+            try:
+                async with async_session() as session:
+                    await job(session, *args)
+                    await session.commit()
+            except Exception:
+                logger.exception("%s job %s%s failed", self.name, job.__name__, args)
+            finally:
+                self.queue.task_done()
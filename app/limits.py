@@ -0,0 +1,350 @@
+"""
+Защита от перегрузки: ограничение частоты запросов клиента и числа одновременно
+обрабатываемых запросов воркера.
+
+Частота ограничивается token bucket на пару (клиент, маршрут): клиент - пользователь
+с уже проверенным ключом API, иначе - IP-адрес; маршрут - метод и шаблон пути
+("GET /api/tweets"). Превышение - 429.
+
+Число одновременных запросов воркера ограничено размером его пула соединений с БД:
+лишние запросы недолго ждут в очереди, а при переполнении очереди или истечении
+ожидания получают 503, а не ждут соединения из пула до DB_POOL_TIMEOUT.
+Оба ответа содержат Retry-After.
+
+Загрузка медиа с Content-Length больше MEDIA_MAX_SIZE отклоняется с 413 до чтения тела.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import metrics
+from app.cache import TTLCache, api_key_cache
+from app.config import settings
+from app.profiling import route_template
+
+
+logger = logging.getLogger(__name__)
+
+# (запросов в секунду, ёмкость корзины)
+Limit = Tuple[float, int]
+
+
+class LocalRateLimitBackend:
+    """
+    Корзины в памяти процесса. При нескольких воркерах лимит действует в каждом отдельно.
+
+    Корзина хранится, пока не наполнится снова: вытесненная или истёкшая запись
+    равносильна полной корзине.
+    """
+
+    def __init__(self, maxsize: int):
+        evictions = metrics.CACHE_EVICTIONS.labels("rate_limit")
+        self._buckets = TTLCache(maxsize=maxsize, ttl=0, on_evict=evictions.inc)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets.set(key, (tokens, now), burst / rate)
+        return wait
+
+
+class RedisRateLimitBackend:
+    """
+    Корзины в Redis, общие для всех воркеров и экземпляров приложения.
+
+    Пополнение и списание выполняются одним Lua-скриптом по часам Redis, поэтому
+    корзина согласована при параллельных запросах с разных хостов.
+    """
+
+    script = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+    def __init__(self, client, prefix: str = "rl:"):
+        self._take = client.register_script(self.script)
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimitBackend":
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' extra to be installed")
+        return cls(redis.from_url(url))
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._take(keys=[f"{self.prefix}{key}"], args=[rate, burst]))
+
+
+class NullRateLimitBackend:
+    """
+    Ограничение частоты отключено.
+    """
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return 0.0
+
+
+class RateLimiter:
+    """
+    Token bucket на клиента и маршрут с лимитом маршрута из RATE_LIMIT_ROUTES
+    или лимитом по умолчанию.
+    """
+
+    def __init__(self, backend, default: Limit, routes: Dict[str, Limit]):
+        self.backend = backend
+        self.default = default
+        self.routes = routes
+
+    async def check(self, client: str, route: str) -> float:
+        """
+        Списание запроса из корзины; возвращает 0, если запрос разрешён, иначе -
+        через сколько секунд в корзине появится место. Ошибка бэкенда не блокирует запросы.
+        """
+
+        rate, burst = self.routes.get(route, self.default)
+        try:
+            return await self.backend.take(f"{client}:{route}", rate, burst)
+        except Exception as exc:
+            metrics.RATE_LIMIT_BACKEND_ERRORS.inc()
+            logger.warning("rate limit backend failed, request allowed: %s", exc)
+            return 0.0
+
+
+def create_rate_limiter() -> RateLimiter:
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        backend = RedisRateLimitBackend.from_url(settings.REDIS_URL)
+    elif settings.RATE_LIMIT_BACKEND == "local":
+        backend = LocalRateLimitBackend(settings.RATE_LIMIT_LOCAL_SIZE)
+    else:
+        backend = NullRateLimitBackend()
+    return RateLimiter(backend, (settings.RATE_LIMIT_RATE, settings.RATE_LIMIT_BURST), settings.RATE_LIMIT_ROUTES)
+
+
+class AdmissionController:
+    """
+    Не больше `max_concurrency` запросов в обработке; следующие ждут освобождения места
+    в очереди FIFO длиной до `queue_size` не дольше `queue_timeout` секунд.
+    """
+
+    def __init__(self, max_concurrency: int, queue_size: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> bool:
+        """
+        Занятие места; False - запрос нужно отклонить.
+        """
+
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self._admit()
+            return True
+
+        if len(self._waiters) >= self.queue_size:
+            metrics.ADMISSION_REJECTED.labels("queue_full").inc()
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        metrics.ADMISSION_QUEUED.inc()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Место могло быть передано одновременно с истечением ожидания
+            if not waiter.done() or waiter.cancelled():
+                metrics.ADMISSION_REJECTED.labels("timeout").inc()
+                return False
+        except asyncio.CancelledError:
+            # Клиент отключился, когда место уже было ему передано: отдаём его следующему
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            metrics.ADMISSION_QUEUED.dec()
+            metrics.ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started)
+            if not waiter.done() or waiter.cancelled():
+                self._remove_waiter(waiter)
+        return True
+
+    def release(self) -> None:
+        # Место переходит первому ждущему, число запросов в обработке не меняется
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+        metrics.ADMISSION_IN_FLIGHT.dec()
+
+    def _admit(self) -> None:
+        self.in_flight += 1
+        metrics.ADMISSION_IN_FLIGHT.inc()
+
+    def _remove_waiter(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+def create_admission_controller() -> AdmissionController:
+    max_concurrency = settings.ADMISSION_MAX_CONCURRENCY or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    return AdmissionController(max_concurrency, settings.ADMISSION_QUEUE_SIZE, settings.ADMISSION_QUEUE_TIMEOUT)
+
+
+rate_limiter = create_rate_limiter()
+admission = create_admission_controller()
+
+
+def client_identity(scope: Scope) -> str:
+    """
+    Клиент для ограничения частоты: пользователь, если его ключ API уже проверен
+    (есть в кэше аутентификации воркера), иначе - IP-адрес. Непроверенный ключ не даёт
+    своей корзины: иначе случайный ключ в каждом запросе обходил бы лимит и вытеснял
+    корзины настоящих клиентов.
+    """
+
+    for name, value in scope["headers"]:
+        if name == b"api-key":
+            user = api_key_cache.get(value.decode("latin-1"))
+            if user is not None:
+                return f"user:{user.id}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def _rejection(status_code: int, error_type: str, message: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"result": False, "error_type": error_type, "error_message": message},
+        headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+    )
+
+
+def _route(scope: Scope) -> Optional[str]:
+    template = route_template(scope)
+    return f"{scope['method']} {template}" if template is not None else None
+
+
+class RateLimitMiddleware:
+    """
+    429 с Retry-After для клиента, исчерпавшего лимит маршрута /api/... .
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        route = _route(scope) if scope["type"] == "http" else None
+        if route is not None and route.split(" ", 1)[1].startswith("/api/"):
+            wait = await rate_limiter.check(client_identity(scope), route)
+            if wait > 0:
+                metrics.RATE_LIMIT_REJECTED.labels(route).inc()
+                response = _rejection(429, "TooManyRequests", f"rate limit exceeded for {route}", wait)
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class AdmissionMiddleware:
+    """
+    503 с Retry-After, если воркер уже обрабатывает предельное число запросов
+    и место не освободилось за время ожидания. Долгоживущие потоки событий
+    и служебные маршруты (ADMISSION_EXEMPT_ROUTES) не учитываются.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _route(scope) in settings.ADMISSION_EXEMPT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        if not await admission.acquire():
+            response = _rejection(503, "ServiceUnavailable", "server is overloaded", settings.ADMISSION_RETRY_AFTER)
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release()
+
+
+class MediaUploadLimitMiddleware:
+    """
+    413 для POST /api/medias с Content-Length заведомо больше MEDIA_MAX_SIZE - до разбора
+    multipart-тела; 400 для некорректного Content-Length. Тело без Content-Length (chunked)
+    ограничивает stream_upload при чтении.
+    """
+
+    path = "/api/medias"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # multipart-обёртка вокруг файла допустимого размера
+        self.max_content_length = settings.MEDIA_MAX_SIZE + settings.MEDIA_CHUNK_SIZE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == self.path:
+            response = self._check(scope)
+            if response is not None:
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+    def _check(self, scope: Scope) -> Optional[JSONResponse]:
+        values = {value.strip() for name, value in scope["headers"] if name == b"content-length"}
+        if not values:
+            return None
+        # Несколько разных значений или не число - тело нельзя разобрать однозначно
+        value = values.pop()
+        if values or not value.isdigit():
+            return self._error(400, "InvalidContentLength", "invalid Content-Length header")
+
+        if int(value) > self.max_content_length:
+            return self._error(413, "MediaTooLarge", f"file exceeds {settings.MEDIA_MAX_SIZE} bytes")
+        return None
+
+    @staticmethod
+    def _error(status_code: int, error_type: str, message: str) -> JSONResponse:
+        return JSONResponse(
+            status_code=status_code,
+            content={"result": False, "error_type": error_type, "error_message": message},
+        )
@@ -1,5 +1,7 @@
-import json
-from typing import Any
+import asyncio
+import importlib
+import logging
+import time
 
 import sentry_sdk
 import uvicorn
@@ -7,31 +9,47 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from prometheus_fastapi_instrumentator import Instrumentator
+from sqlalchemy.orm import configure_mappers
 
-from app.routes import router
+from app.config import settings
+from app.responses import DefaultResponse
+from app.routes import router, media_router
 from app import schemas
+from app import media_gc
+from app import realtime
+from app import thumbnails
+from app import timeline
+from app import metrics
+from app.db.session import engine, prefill_pool, replicas
+from app.storage import storage
+from app.limits import AdmissionMiddleware, MediaUploadLimitMiddleware, RateLimitMiddleware
+from app.profiling import FirstRequestMiddleware, QueryStatsMiddleware
 
-sentry_sdk.init(
-    dsn="https://0303c01fe6244ed4a2bb56d9aa79646a@o1114395.ingest.sentry.io/4504328211398656",
-
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring.
-    # We recommend adjusting this value in production,
-    traces_sample_rate=1.0,
-    _experiments={
-        "profiles_sample_rate": 1.0,
-      },
-)
 
+logger = logging.getLogger(__name__)
 
-class DefaultResponse(JSONResponse):
-    def render(self, content: Any) -> bytes:
-        if content is None:
-            content = schemas.DefaultSuccessSchema().dict()
+# Интеграции Sentry подключаются при импорте, до создания приложения. С preload_app
+# это происходит в мастере gunicorn; фоновый поток отправки Sentry перезапускается
+# в каждом воркере после fork сам.
+if settings.SENTRY_DSN:
+    sentry_sdk.init(
+        dsn=settings.SENTRY_DSN,
+        environment=settings.SENTRY_ENVIRONMENT,
+        traces_sample_rate=settings.SENTRY_TRACES_SAMPLE_RATE,
+        _experiments={
+            "profiles_sample_rate": settings.SENTRY_PROFILES_SAMPLE_RATE,
+        },
+    )
 
-        if isinstance(content, bytes):
-            return content
-        return json.dumps(content).encode(self.charset)
+# Работа, которая иначе выполняется на первом запросе каждого воркера; с preload_app -
+# один раз в мастере: настройка маперов и бэкенд anyio (его импортирует первый вызов
+# run_in_threadpool: загрузка файла, статика, синхронный обработчик исключений)
+configure_mappers()
+try:
+    # Внутренний модуль anyio: если его переименуют, он просто загрузится на первом запросе
+    importlib.import_module("anyio._backends._asyncio")
+except ImportError:
+    pass
 
 
 app = FastAPI(
@@ -41,12 +59,54 @@ app = FastAPI(
     }
 )
 app.include_router(router)
+app.include_router(media_router)
+# /metrics должен быть зарегистрирован до статики, смонтированной на "/"
+instrumentator = Instrumentator().expose(app)
 app.mount("/", StaticFiles(directory="app/static", html=True), name="static")
 
 
+# Добавленный последним выполняется первым. Порядок обработки запроса: FirstRequest ->
+# MediaUploadLimit -> RateLimit -> Admission -> QueryStats -> маршрут (Instrumentator
+# добавляется в startup и оказывается снаружи всех). Отказы по размеру загрузки и лимитам -
+# до сессии БД и любой работы обработчика; клиент сверх своего лимита частоты не занимает
+# место в ограничении числа одновременных запросов; запросы к БД считаются только у принятых
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MediaUploadLimitMiddleware)
+app.add_middleware(FirstRequestMiddleware)
+
+
 @app.on_event("startup")
 async def startup():
-    Instrumentator().instrument(app).expose(app)
+    started = time.perf_counter()
+    instrumentator.instrument(app)
+    # Соединения открываются в воркере: сокеты, открытые в мастере до fork, воркерам не годятся
+    await asyncio.gather(
+        *(prefill_pool(pool_engine, settings.DB_POOL_PREFILL) for pool_engine in [engine, *replicas.engines])
+    )
+    await replicas.start()
+    await storage.start()
+    await media_gc.cleanup.start()
+    await media_gc.reaper.start()
+    await thumbnails.start()
+    await realtime.hub.start()
+    if timeline.is_push_mode():
+        await timeline.fanout.start()
+    metrics.APP_STARTUP_SECONDS.set(time.perf_counter() - started)
+    logger.info("startup took %.3fs", time.perf_counter() - started)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await replicas.stop()
+    await realtime.hub.stop()
+    await thumbnails.stop()
+    await media_gc.reaper.stop()
+    await media_gc.cleanup.stop()
+    await storage.stop()
+    if timeline.is_push_mode():
+        await timeline.fanout.stop()
 
 
 @app.exception_handler(Exception)
@@ -62,4 +122,5 @@ def base_exception_handler(request: Request, exc: Exception):
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", port=8111, reload=True, debug=True)  # for debug
+    # Только для локальной разработки; в продакшене - gunicorn -c gunicorn_conf.py app.main:app
+    uvicorn.run("app.main:app", host="127.0.0.1", port=8111, reload=True)
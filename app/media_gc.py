@@ -0,0 +1,246 @@
+"""
+Сборка медиа, на которые не ссылается ни один твит.
+
+Медиа, оставшиеся без ссылок после удаления твита, ставятся в очередь `cleanup` сразу;
+загруженные, но так и не прикреплённые - находит периодический `reaper` по истечении
+периода ожидания. Ручной запуск одного прохода (из корня проекта):
+
+    PYTHONPATH=.:app python -m app.media_gc --dry-run
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import BigInteger, and_, Integer, any_, bindparam, delete, exists, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app import models
+from app.config import settings
+from app.db.session import async_session
+from app.jobs import BackgroundWorker
+from app.storage import storage
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: проход сборщика выполняет только один воркер
+REAPER_LOCK_ID = 0x6D65646961
+
+cleanup = BackgroundWorker("media_gc", 1, settings.MEDIA_GC_QUEUE_SIZE)
+
+
+def unreferenced():
+    """
+    Условие "оригинал медиа, на который не ссылается ни один твит". Уменьшенные копии
+    удаляются каскадом вместе с оригиналом.
+    """
+
+    return and_(models.Media.parent_id.is_(None), ~exists().where(models.tweet_media.c.media_id == models.Media.id))
+
+
+def collectable(cutoff: datetime):
+    """
+    Условие "оригинал без ссылок, созданный или повторно загруженный раньше `cutoff`".
+
+    Проверяется и при выборе, и в самом DELETE: повторная загрузка того же содержимого
+    обновляет created_at, и строка, изменённая после выбора, не удаляется.
+    """
+
+    return and_(unreferenced(), models.Media.created_at < cutoff)
+
+
+def grace_cutoff(grace_period: float) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=grace_period)
+
+
+def with_variants(media):
+    """
+    Строки (id, path, size) медиа из `media` и их уменьшенных копий; у копий id - оригинала.
+
+    Для `media` из DELETE ... RETURNING копии ещё видны: запрос читает снимок до каскадного удаления.
+    """
+
+    variants = select(models.Media.parent_id, models.Media.path, models.Media.size).where(
+        models.Media.parent_id.in_(select(media.c.id))
+    )
+    return select(media.c.id, media.c.path, media.c.size).union_all(variants)
+
+
+async def remove_files(keys: List[str]) -> int:
+    """
+    Удаление файлов медиа из хранилища; возвращает число освобождённых байт.
+    Отсутствующие файлы пропускаются.
+    """
+
+    reclaimed = 0
+    for key in keys:
+        try:
+            reclaimed += await storage.delete(key)
+        except Exception:
+            logger.exception("failed to remove media file %s", key)
+
+    metrics.MEDIA_GC_RECLAIMED_BYTES.inc(reclaimed)
+    return reclaimed
+
+
+async def collect_orphans(session: AsyncSession, media_ids: List[int]) -> None:
+    """
+    Удаление медиа из списка, на которые больше не ссылается ни один твит, вместе с файлами.
+    Медиа моложе MEDIA_GC_GRACE_PERIOD остаются: их только что загрузили повторно и могут
+    прикрепить к новому твиту; если нет - их удалит `reaper`.
+
+    Файлы удаляются только после фиксации удаления строк: при откате файл остаётся на месте.
+    """
+
+    cutoff = grace_cutoff(settings.MEDIA_GC_GRACE_PERIOD)
+    deleted = (
+        delete(models.Media)
+        .where(models.Media.id == any_(bindparam("media_ids", media_ids, type_=ARRAY(Integer))), collectable(cutoff))
+        .returning(models.Media.id, models.Media.path, models.Media.size)
+        .cte("deleted")
+    )
+    rows = (await session.execute(with_variants(deleted))).all()
+    await session.commit()
+
+    metrics.MEDIA_GC_DELETED.inc(len({row.id for row in rows}))
+    if rows:
+        await remove_files([row.path for row in rows if row.path])
+
+
+class MediaReaper:
+    """
+    Периодический проход по медиа без ссылок старше периода ожидания.
+
+    Медиа удаляются пачками по keyset (id), между пачками выдерживается пауза,
+    ограничивающая число удаляемых файлов в секунду, чтобы не мешать вводу-выводу
+    основных запросов.
+    """
+
+    def __init__(self, interval: float, grace_period: float, batch_size: int, max_files_per_second: float):
+        self.interval = interval
+        self.grace_period = grace_period
+        self.batch_size = batch_size
+        self.max_files_per_second = max_files_per_second
+        self._task: Optional[asyncio.Task] = None
+
+    def candidates(self, after_id: int, cutoff: datetime):
+        return (
+            select(models.Media.id)
+            .where(models.Media.id > after_id, collectable(cutoff))
+            .order_by(models.Media.id)
+            .limit(self.batch_size)
+        )
+
+    async def collect(self, dry_run: bool = False) -> Tuple[int, int]:
+        """
+        Один проход сборщика; возвращает число удалённых медиа и освобождённых байт
+        (при dry_run - сколько было бы удалено).
+        """
+
+        cutoff = grace_cutoff(self.grace_period)
+        deleted, reclaimed, after_id = 0, 0, 0
+
+        while True:
+            started = time.monotonic()
+            async with async_session() as session:
+                locked = await session.scalar(select(func.pg_try_advisory_xact_lock(literal(REAPER_LOCK_ID, BigInteger))))
+                if not locked:
+                    logger.info("media reaper is running in another process, skipping")
+                    break
+
+                # Проход продолжается, пока есть кандидаты: часть пачки может отсеять
+                # повторная проверка в DELETE, если медиа за это время прикрепили или загрузили снова
+                batch = (await session.scalars(self.candidates(after_id, cutoff))).all()
+                if not batch:
+                    break
+                after_id = batch[-1]
+
+                batch_ids = bindparam("batch_ids", batch, type_=ARRAY(Integer))
+                if dry_run:
+                    media = (
+                        select(models.Media.id, models.Media.path, models.Media.size)
+                        .where(models.Media.id == any_(batch_ids))
+                        .cte("batch_media")
+                    )
+                else:
+                    media = (
+                        delete(models.Media)
+                        .where(models.Media.id == any_(batch_ids), collectable(cutoff))
+                        .returning(models.Media.id, models.Media.path, models.Media.size)
+                        .cte("deleted")
+                    )
+                rows = (await session.execute(with_variants(media))).all()
+                await session.commit()
+
+            originals = len({row.id for row in rows})
+            deleted += originals
+            if dry_run:
+                reclaimed += sum(row.size or 0 for row in rows)
+            else:
+                metrics.MEDIA_GC_DELETED.inc(originals)
+                reclaimed += await remove_files([row.path for row in rows if row.path])
+
+            if self.max_files_per_second:
+                await asyncio.sleep(max(len(rows) / self.max_files_per_second - (time.monotonic() - started), 0))
+
+        return deleted, reclaimed
+
+    async def start(self) -> None:
+        if self.interval:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                deleted, reclaimed = await self.collect()
+            except Exception:
+                logger.exception("media reaper pass failed")
+            else:
+                if deleted:
+                    logger.info("media reaper removed %s media, %s bytes", deleted, reclaimed)
+
+
+reaper = MediaReaper(
+    settings.MEDIA_GC_INTERVAL,
+    settings.MEDIA_GC_GRACE_PERIOD,
+    settings.MEDIA_GC_BATCH_SIZE,
+    settings.MEDIA_GC_MAX_FILES_PER_SECOND,
+)
+
+
+async def run_once(reaper_pass: MediaReaper, dry_run: bool) -> Tuple[int, int]:
+    """
+    Один проход сборщика вне приложения: клиент хранилища (S3) создаётся в `storage.start`,
+    без него файлы не удалились бы, хотя строки медиа уже удалены.
+    """
+
+    await storage.start()
+    try:
+        return await reaper_pass.collect(dry_run=dry_run)
+    finally:
+        await storage.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что было бы удалено")
+    parser.add_argument("--grace-period", type=float, default=settings.MEDIA_GC_GRACE_PERIOD, help="секунды")
+    parser.add_argument("--batch-size", type=int, default=settings.MEDIA_GC_BATCH_SIZE)
+    parser.add_argument("--max-files-per-second", type=float, default=settings.MEDIA_GC_MAX_FILES_PER_SECOND)
+    args = parser.parse_args()
+
+    one_pass = MediaReaper(0, args.grace_period, args.batch_size, args.max_files_per_second)
+    count, size = asyncio.run(run_once(one_pass, args.dry_run))
+    print(f"{'would remove' if args.dry_run else 'removed'} {count} media, {size} bytes")
@@ -0,0 +1,131 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Number of connections currently checked out of the pool.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Number of overflow connections currently open above pool_size.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured number of persistent connections in the pool.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool.",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+CACHE_HITS = Counter(
+    "cache_hits_total",
+    "Number of response cache lookups that returned a stored response.",
+    ["cache"],
+)
+CACHE_MISSES = Counter(
+    "cache_misses_total",
+    "Number of response cache lookups that found nothing.",
+    ["cache"],
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total",
+    "Number of entries evicted from an in-process cache by its size limit.",
+    ["cache"],
+)
+
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "Number of SQL statements executed while handling a request.",
+    ["method", "handler"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Total time spent executing SQL statements while handling a request.",
+    ["method", "handler"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+DB_SLOWEST_QUERY = Histogram(
+    "db_slowest_query_seconds",
+    "Duration of the slowest SQL statement executed while handling a request.",
+    ["method", "handler"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+MEDIA_GC_DELETED = Counter(
+    "media_gc_deleted_total",
+    "Number of unreferenced media rows deleted by the media garbage collector.",
+)
+MEDIA_GC_RECLAIMED_BYTES = Counter(
+    "media_gc_reclaimed_bytes_total",
+    "Bytes of media files removed by the media garbage collector.",
+)
+
+REALTIME_CONNECTIONS = Gauge(
+    "realtime_connections",
+    "Number of open realtime (SSE and WebSocket) connections in this process.",
+    multiprocess_mode="livesum",
+)
+REALTIME_EVENTS = Counter(
+    "realtime_events_delivered_total",
+    "Number of realtime events queued to client connections.",
+    ["type"],
+)
+REALTIME_OVERFLOWS = Counter(
+    "realtime_queue_overflows_total",
+    "Number of times a slow client's event queue overflowed and was replaced by a resync event.",
+)
+REALTIME_PUBLISH_DROPPED = Counter(
+    "realtime_publish_dropped_total",
+    "Number of realtime events dropped before reaching the broker (publish queue full or send failed).",
+)
+
+RATE_LIMIT_REJECTED = Counter(
+    "rate_limit_rejected_total",
+    "Number of requests rejected with 429 because the client exceeded the route's rate limit.",
+    ["route"],
+)
+RATE_LIMIT_BACKEND_ERRORS = Counter(
+    "rate_limit_backend_errors_total",
+    "Number of rate limit checks that failed in the backend and let the request through.",
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight_requests",
+    "Number of requests admitted by the concurrency limiter and currently being handled.",
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued_requests",
+    "Number of requests waiting for a concurrency limiter slot.",
+    multiprocess_mode="livesum",
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Number of requests shed with 503 by the concurrency limiter.",
+    ["reason"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds",
+    "Time requests spent queued for a concurrency limiter slot.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+APP_STARTUP_SECONDS = Gauge(
+    "app_startup_seconds",
+    "Time spent in the application startup hook (pool warm-up, background workers).",
+    multiprocess_mode="max",
+)
+APP_TIME_TO_FIRST_REQUEST = Gauge(
+    "app_time_to_first_request_seconds",
+    "Time from worker process start to the end of its first HTTP response.",
+    multiprocess_mode="max",
+)
@@ -1,7 +1,11 @@
 from typing import List
 
-from sqlalchemy import Column, DateTime, Text, Integer, ForeignKey, Table, PrimaryKeyConstraint, CheckConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    BigInteger, Column, Computed, DateTime, Text, Integer, ForeignKey, Table, PrimaryKeyConstraint, CheckConstraint,
+    Index, UniqueConstraint
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 
 from .db.base import Base
@@ -10,23 +14,43 @@ from .db.base import Base
 tweet_media = Table(
     "tweet_media",
     Base.metadata,
-    Column("tweet_id", ForeignKey("tweet.id")),
+    Column("tweet_id", ForeignKey("tweet.id", ondelete="CASCADE")),
     Column("media_id", ForeignKey("media.id")),
-    PrimaryKeyConstraint("tweet_id", "media_id")
+    PrimaryKeyConstraint("tweet_id", "media_id"),
+    Index("ix_tweet_media_media_id", "media_id"),
 )
 
 
+# Конфигурация полнотекстового поиска зашита в выражение генерируемой колонки
+# tweet.search_vector; запросы должны строить tsquery с той же конфигурацией.
+# "simple" не привязана к языку: тексты бывают и на русском, и на английском.
+TWEET_SEARCH_CONFIG = "simple"
+
+
 class Tweet(Base):
     __tablename__ = "tweet"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("user.id"))
     post = Column(Text)
+    like_count = Column(Integer, nullable=False, server_default="0")
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Не загружается вместе с твитом: нужна только в условиях поиска
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(f"to_tsvector('{TWEET_SEARCH_CONFIG}'::regconfig, coalesce(post, ''))", persisted=True))
+    )
+
+    # Лайки и связи с медиа удаляются каскадом в БД (ON DELETE CASCADE), без загрузки в сессию
+    favorites = relationship(
+        "Favorite", backref="tweet", cascade="all, delete", passive_deletes=True, uselist=True, lazy="selectin"
+    )
+    media = relationship("Media", secondary=tweet_media, passive_deletes=True, uselist=True, lazy="selectin")
 
-    favorites = relationship("Favorite", backref="tweet", cascade="all, delete", uselist=True, lazy="selectin")
-    media = relationship("Media", secondary=tweet_media, uselist=True, lazy="selectin")
+    __table_args__ = (
+        Index("ix_tweet_user_id_created_at_id", user_id, created_at.desc(), id.desc()),
+        Index("ix_tweet_search_vector", search_vector, postgresql_using="gin"),
+    )
 
     __mapper_args__ = {"eager_defaults": True}
 
@@ -36,16 +60,31 @@ class Media(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     path = Column(Text)
+    size = Column(BigInteger)
+    sha256 = Column(Text, unique=True, index=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Уменьшенные копии изображения (thumbnail, medium, ...) ссылаются на оригинал
+    parent_id = Column(Integer, ForeignKey("media.id", ondelete="CASCADE"), index=True)
+    variant = Column(Text)
+    width = Column(Integer)
+    height = Column(Integer)
+
+    variants = relationship("Media", passive_deletes=True, uselist=True, lazy="raise")
+
+    __table_args__ = (
+        UniqueConstraint(parent_id, variant),
+    )
 
 
 class Favorite(Base):
     __tablename__ = "favorite"
 
     user_id = Column(Integer, ForeignKey("user.id"))
-    tweet_id = Column(Integer, ForeignKey("tweet.id"))
+    tweet_id = Column(Integer, ForeignKey("tweet.id", ondelete="CASCADE"))
 
     __table_args__ = (
         PrimaryKeyConstraint(user_id, tweet_id),
+        Index("ix_favorite_tweet_id_user_id", tweet_id, user_id),
     )
 
 
@@ -54,7 +93,11 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(Text, nullable=False)
-    key = Column(Text, nullable=False)
+    key = Column(Text, nullable=False, unique=True, index=True)
+    follower_count = Column(Integer, nullable=False, server_default="0", index=True)
+    following_count = Column(Integer, nullable=False, server_default="0")
+    # Меняется при каждой подписке и отписке с участием пользователя (для ETag профиля)
+    graph_version = Column(Integer, nullable=False, server_default="0")
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
@@ -63,7 +106,7 @@ class User(Base):
         primaryjoin=lambda: User.id == user_following.c.user_id,
         secondaryjoin=lambda: User.id == user_following.c.following_id,
         uselist=True,
-        lazy="selectin"
+        lazy="raise"
     )
 
     followers: List = relationship(
@@ -71,10 +114,10 @@ class User(Base):
         primaryjoin=lambda: User.id == user_following.c.following_id,
         secondaryjoin=lambda: User.id == user_following.c.user_id,
         uselist=True,
-        lazy="selectin"
+        lazy="raise"
     )
 
-    tweets: List[Tweet] = relationship("Tweet", backref="user", uselist=True, lazy="selectin")
+    tweets: List[Tweet] = relationship("Tweet", backref="user", uselist=True, lazy="raise")
     favorites: List[Favorite] = relationship("Favorite", backref="user", uselist=True)
 
     __mapper_args__ = {"eager_defaults": True}
@@ -85,5 +128,20 @@ user_following = Table(
     Column('user_id', Integer, ForeignKey(User.id), primary_key=True),
     Column('following_id', Integer, ForeignKey(User.id), primary_key=True),
     CheckConstraint('user_id <> following_id'),
-    PrimaryKeyConstraint('user_id', 'following_id')
+    PrimaryKeyConstraint('user_id', 'following_id'),
+    Index('ix_user_following_following_id_user_id', 'following_id', 'user_id'),
 )
+
+
+class Timeline(Base):
+    __tablename__ = "timeline"
+
+    user_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    tweet_id = Column(Integer, ForeignKey("tweet.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint(user_id, tweet_id),
+        Index("ix_timeline_user_id_created_at_tweet_id", user_id, created_at.desc(), tweet_id.desc()),
+        Index("ix_timeline_tweet_id", tweet_id),
+    )
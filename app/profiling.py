@@ -0,0 +1,174 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_imported_at = time.monotonic()
+
+
+class QueryStats:
+    """
+    Статистика обращений к БД в рамках одного запроса.
+    """
+
+    __slots__ = ("count", "total", "slowest", "slowest_statement", "method", "path")
+
+    def __init__(self, method: str = "", path: str = ""):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.method = method
+        self.path = path
+
+    def add(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        if duration > self.slowest:
+            self.slowest = duration
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total * 1000:.2f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest * 1000:.2f}"
+        )
+
+
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+
+    stats = current_stats.get()
+    if stats is not None:
+        stats.add(statement, duration)
+
+    if settings.DB_SLOW_QUERY_THRESHOLD and duration >= settings.DB_SLOW_QUERY_THRESHOLD:
+        origin = f"{stats.method} {stats.path}" if stats is not None else "background"
+        logger.warning("slow query %.3fs (%s): %s", duration, origin, statement)
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_query_timer(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def route_template(scope: Scope) -> Optional[str]:
+    """
+    Шаблон пути обработчика ("/api/users/{id}") - метка с ограниченным числом значений.
+    Для статики и несуществующих путей возвращается None. Результат запоминается в scope:
+    шаблон нужен нескольким middleware.
+    """
+
+    if "route_template" not in scope:
+        scope["route_template"] = None
+        for route in getattr(scope.get("app"), "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                scope["route_template"] = getattr(route, "path", None) or None
+                break
+    return scope["route_template"]
+
+
+class QueryStatsMiddleware:
+    """
+    Сбор числа запросов к БД, их суммарного времени и самого медленного запроса
+    для каждого HTTP-запроса: гистограммы с меткой обработчика и, при SERVER_TIMING,
+    заголовок Server-Timing в ответе.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope["method"], scope["path"])
+        token = current_stats.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and settings.SERVER_TIMING:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            handler = route_template(scope)
+            if handler is not None:
+                metrics.DB_QUERIES_PER_REQUEST.labels(stats.method, handler).observe(stats.count)
+                metrics.DB_TIME_PER_REQUEST.labels(stats.method, handler).observe(stats.total)
+                metrics.DB_SLOWEST_QUERY.labels(stats.method, handler).observe(stats.slowest)
+
+
+def process_uptime() -> float:
+    """
+    Сколько секунд назад запущен текущий процесс. Для воркера gunicorn - с момента fork,
+    а не запуска мастера. Вне Linux - с момента импорта этого модуля.
+    """
+
+    try:
+        with open("/proc/self/stat") as f:
+            # Имя процесса в скобках может содержать пробелы - поля считаются после него
+            fields = f.read().rsplit(")", 1)[1].split()
+        # Время запуска в /proc - в тиках от загрузки системы, по тем же часам, что CLOCK_BOOTTIME
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic() - _imported_at
+
+
+class FirstRequestMiddleware:
+    """
+    Замер времени от запуска процесса до ответа на первый HTTP-запрос (time-to-first-request):
+    импорт приложения, startup-хуки и сам первый запрос с холодными пулами и кэшами.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.done = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.done or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.done = True
+        request_started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Возраст процесса определяется здесь, а не в __init__: с preload_app приложение
+            # создаётся в мастере, а запросы обслуживает воркер
+            uptime = process_uptime()
+            metrics.APP_TIME_TO_FIRST_REQUEST.set(uptime)
+            logger.info(
+                "pid %s: first request %s %s served %.3fs after process start (request took %.3fs)",
+                os.getpid(), scope["method"], scope["path"], uptime, time.perf_counter() - request_started,
+            )
@@ -0,0 +1,268 @@
+"""
+Доставка событий ленты подключённым клиентам (SSE и WebSocket) вместо опроса GET /api/tweets.
+
+Обработчики записи публикуют события через `hub.publish` после фиксации транзакции.
+Брокер доставляет каждое событие хабам всех воркеров: `local` - только внутри процесса,
+`postgres` - через LISTEN/NOTIFY, чтобы события доходили до клиентов других воркеров uvicorn.
+Хаб воркера раздаёт событие только своим подключениям: события твита - подписчикам автора,
+события подписки - самому подписавшемуся.
+
+У каждого подключения ограниченная очередь. Медленный клиент не задерживает остальных:
+при переполнении его очередь очищается и в неё кладётся одно событие `resync` - клиент
+должен заново запросить ленту.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set
+
+import orjson
+
+from app import metrics
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+Event = dict
+Handler = Callable[[Event], None]
+
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """
+    Подключение пользователя: очередь событий и id авторов, на которых он подписан.
+    """
+
+    def __init__(self, user_id: int, following: Iterable[int], queue_size: int):
+        self.user_id = user_id
+        self.following: Set[int] = set(following)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def deliver(self, event: Event) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            metrics.REALTIME_OVERFLOWS.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """
+        Следующее событие; None, если за `timeout` секунд событий не было.
+        """
+
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """
+    Брокер внутри процесса: событие сразу передаётся хабу этого же воркера.
+    """
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler) -> None:
+        self._handler = handler
+
+    async def stop(self) -> None:
+        self._handler = None
+
+    async def publish(self, event: Event) -> None:
+        if self._handler is not None:
+            self._handler(event)
+
+
+class PostgresBroker:
+    """
+    Брокер на LISTEN/NOTIFY основной БД: события доходят до всех воркеров, подключённых к ней.
+
+    Слушающее соединение держится отдельно от пула SQLAlchemy. При его потере брокер
+    переподключается и рассылает `resync`: события за время разрыва могли потеряться.
+
+    Публикация не ждёт БД: событие кладётся в ограниченную очередь, которую одна задача
+    отправляет пачками через собственное соединение. При переполнении очереди или ошибке
+    отправки события отбрасываются (realtime_publish_dropped_total) - запись уже выполнена,
+    а клиенты получат изменения при следующем запросе ленты.
+    """
+
+    def __init__(self, dsn: str, channel: str, reconnect_delay: float, queue_size: int):
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.queue_size = queue_size
+        self._handler: Optional[Handler] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, handler: Handler) -> None:
+        self._handler = handler
+        self._outbox = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._listen_loop()), asyncio.create_task(self._publish_loop())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def publish(self, event: Event) -> None:
+        try:
+            self._outbox.put_nowait(orjson.dumps(event).decode())
+        except asyncio.QueueFull:
+            metrics.REALTIME_PUBLISH_DROPPED.inc()
+
+    async def _publish_loop(self) -> None:
+        import asyncpg
+
+        connection = None
+        try:
+            while True:
+                payloads = [await self._outbox.get()]
+                while not self._outbox.empty():
+                    payloads.append(self._outbox.get_nowait())
+                try:
+                    if connection is None or connection.is_closed():
+                        connection = await asyncpg.connect(self.dsn)
+                    # Одна транзакция на пачку: слушатели получают события в порядке публикации
+                    await connection.execute(
+                        "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload", self.channel, payloads
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    metrics.REALTIME_PUBLISH_DROPPED.inc(len(payloads))
+                    logger.exception("failed to publish %s realtime events", len(payloads))
+                    if connection is not None:
+                        connection.terminate()
+                        connection = None
+                    await asyncio.sleep(self.reconnect_delay)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            event = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            logger.warning("malformed realtime event: %r", payload)
+            return
+        self._handler(event)
+
+    async def _listen_loop(self) -> None:
+        import asyncpg
+
+        reconnecting = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(self.channel, self._on_notify)
+                if reconnecting:
+                    self._handler(RESYNC)
+                reconnecting = True
+                await lost.wait()
+                logger.warning("realtime listener connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("realtime listener failed, reconnecting")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+class RealtimeHub:
+    """
+    Раздача событий подключениям воркера. Индекс "автор -> подключения его подписчиков"
+    хранится в памяти и обновляется событиями подписки, поэтому на событие не нужен запрос к БД.
+    """
+
+    def __init__(self, broker, queue_size: int):
+        self.broker = broker
+        self.queue_size = queue_size
+        self._by_user: Dict[int, Set[Subscription]] = {}
+        self._by_author: Dict[int, Set[Subscription]] = {}
+
+    async def start(self) -> None:
+        await self.broker.start(self.dispatch)
+
+    async def stop(self) -> None:
+        await self.broker.stop()
+
+    async def publish(self, event: Event) -> None:
+        """
+        Публикация события; ошибка брокера не должна ломать уже выполненную запись.
+        """
+
+        try:
+            await self.broker.publish(event)
+        except Exception:
+            logger.exception("failed to publish realtime event %s", event.get("type"))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int, following: Iterable[int]) -> AsyncIterator[Subscription]:
+        subscription = Subscription(user_id, following, self.queue_size)
+        self._by_user.setdefault(user_id, set()).add(subscription)
+        for author_id in subscription.following:
+            self._by_author.setdefault(author_id, set()).add(subscription)
+        metrics.REALTIME_CONNECTIONS.inc()
+        try:
+            yield subscription
+        finally:
+            metrics.REALTIME_CONNECTIONS.dec()
+            for author_id in subscription.following:
+                self._discard(self._by_author, author_id, subscription)
+            self._discard(self._by_user, user_id, subscription)
+
+    def dispatch(self, event: Event) -> None:
+        kind = event.get("type")
+        if kind == RESYNC["type"]:
+            recipients = {s for subscriptions in self._by_user.values() for s in subscriptions}
+        elif kind in ("follow.created", "follow.deleted"):
+            recipients = self._by_user.get(event["user_id"], set())
+            for subscription in recipients:
+                self._update_following(subscription, event["following_id"], kind == "follow.created")
+        else:
+            recipients = self._by_author.get(event.get("author_id"), set())
+
+        for subscription in tuple(recipients):
+            subscription.deliver(event)
+        metrics.REALTIME_EVENTS.labels(kind or "unknown").inc(len(recipients))
+
+    def _update_following(self, subscription: Subscription, author_id: int, follow: bool) -> None:
+        if follow:
+            subscription.following.add(author_id)
+            self._by_author.setdefault(author_id, set()).add(subscription)
+        else:
+            subscription.following.discard(author_id)
+            self._discard(self._by_author, author_id, subscription)
+
+    @staticmethod
+    def _discard(index: Dict[int, Set[Subscription]], key: int, subscription: Subscription) -> None:
+        subscriptions = index.get(key)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del index[key]
+
+
+def create_broker():
+    if settings.REALTIME_BROKER == "postgres":
+        dsn = str(settings.SQLALCHEMY_DATABASE_URI).replace("postgresql+asyncpg://", "postgresql://")
+        return PostgresBroker(
+            dsn, settings.REALTIME_CHANNEL, settings.REALTIME_RECONNECT_DELAY, settings.REALTIME_PUBLISH_QUEUE_SIZE
+        )
+    return LocalBroker()
+
+
+hub = RealtimeHub(create_broker(), settings.REALTIME_QUEUE_SIZE)
@@ -0,0 +1,159 @@
+import hashlib
+import re
+from typing import Any, Optional, Tuple
+
+import orjson
+from aiofiles import open as async_open
+from fastapi.responses import JSONResponse
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app import schemas
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class DefaultResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if content is None:
+            content = schemas.DefaultSuccessSchema().dict()
+
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбор одиночного диапазона из заголовка Range.
+
+    Возвращает включительные границы (start, end); None - если диапазон не задан
+    или задан несколькими интервалами (тогда отдаётся весь файл).
+    Для невыполнимого диапазона выбрасывается ValueError.
+    """
+
+    if not header:
+        return None
+
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        suffix = int(end)
+        if suffix == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - suffix, 0), size - 1
+
+    first = int(start)
+    last = int(end) if end else size - 1
+    if first >= size or first > last:
+        raise ValueError("unsatisfiable range")
+    return first, min(last, size - 1)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """
+    Слабое сравнение ETag с заголовком If-None-Match.
+    """
+
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def weak_etag(*markers: Any) -> str:
+    """
+    Слабый ETag по маркерам версии ответа (id, updated_at, версии, параметры запроса)
+    вместо хэша тела: его можно проверить, не загружая и не сериализуя данные.
+    """
+
+    digest = hashlib.blake2b("|".join(map(str, markers)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def revalidation_headers(etag: str) -> dict:
+    # Ответы персональные: хранить можно только клиенту и только с проверкой через If-None-Match
+    return {"etag": etag, "cache-control": "private, no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=revalidation_headers(etag))
+
+
+class MediaFileResponse(Response):
+    """
+    Отдача файла (целиком или диапазона байт) без загрузки в память.
+
+    Если ASGI-сервер поддерживает расширение `http.response.zerocopysend`,
+    файл передаётся через sendfile, иначе - чтением фиксированными блоками.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+            self,
+            path: str,
+            size: int,
+            media_type: Optional[str] = None,
+            headers: Optional[dict] = None,
+            byte_range: Optional[Tuple[int, int]] = None,
+            background: Optional[BackgroundTask] = None,
+    ):
+        self.path = path
+        self.start, self.end = byte_range if byte_range is not None else (0, size - 1)
+        self.status_code = 206 if byte_range is not None else 200
+        self.media_type = media_type
+        self.background = background
+        self.init_headers(headers)
+
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        if byte_range is not None:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        count = self.end - self.start + 1
+        if scope.get("method") == "HEAD" or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": file,
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False,
+                })
+        else:
+            async with async_open(self.path, "rb") as file:
+                await file.seek(self.start)
+                while count > 0:
+                    chunk = await file.read(min(self.chunk_size, count))
+                    if not chunk:
+                        break
+                    count -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+                if count > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        if self.background is not None:
+            await self.background()
@@ -1,53 +1,98 @@
+import asyncio
 import os
-import json
-
-from aiofiles import open as async_open
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, Path
+from datetime import datetime
+from typing import List, Optional, Set, Type, Union
+
+from aiofiles import os as async_os
+import orjson
+from fastapi import (
+    APIRouter, Depends, Header, HTTPException, UploadFile, Path, Query, Request, Response, WebSocket,
+    WebSocketDisconnect, status
+)
+from fastapi.responses import RedirectResponse, StreamingResponse
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import delete
-
-from app.depends import get_crt_user, get_session, get_crt_tweet, get_crt_favorite, get_user_by_id
+from sqlalchemy import Integer, any_, bindparam, cast, delete, exists, func, insert, literal, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload, raiseload, selectinload
+
+from app.depends import (
+    CurrentUser, get_crt_user, get_session, get_read_session, invalidate_api_key, load_user_profile,
+    resolve_api_key, track_writes
+)
+from app.cache import response_cache
 from app.config import settings
-from app.utils import get_rnd_file_name_by_content_type
+from app.responses import (
+    DefaultResponse, MediaFileResponse, etag_matches, not_modified, parse_range, revalidation_headers, weak_etag
+)
+from app.storage import extension_for_content_type, media_content_type, media_key, storage
+from app.utils import (
+    MediaTooLarge, decode_feed_cursor, decode_search_cursor, encode_feed_cursor, encode_search_cursor, stream_upload
+)
 from app import schemas
 from app import models
+from app import timeline
+from app import counters
+from app import media_gc
+from app import realtime
+from app import search
+from app import thumbnails
 
 
 router = APIRouter(
-    dependencies=[Depends(get_crt_user)],
+    dependencies=[Depends(get_crt_user), Depends(track_writes)],
 )
 
+# Медиа запрашиваются браузером напрямую (<img src>), поэтому без api-key
+media_router = APIRouter()
+
 
 @router.post("/api/tweets", response_model=schemas.PostTweetResponseSchema, status_code=201, tags=["tweets"])
 async def post_tweet(
         data: schemas.PostTweetSchema,
-        user: models.User = Depends(get_crt_user),
+        user: CurrentUser = Depends(get_crt_user),
         session: AsyncSession = Depends(get_session)
 ):
     """
     Endpoint по отправке твита.
-    """
-
-    tweet = models.Tweet(user_id=user.id, post=data.tweet_data)
-    session.add(tweet)
-    await session.flush()
 
-    for media_id in data.tweet_media_ids:
-        stmt = select(models.Media).filter_by(id=media_id)
-        result = await session.execute(stmt, execution_options={"populate_existing": True})
-        media = result.scalars().one_or_none()
-        if not media:
-            raise HTTPException(status_code=404, detail=f"media {media_id} not found")
+    Число обращений к БД не зависит от количества вложений: все медиа проверяются
+    одним запросом, связи с твитом вставляются одним INSERT ... SELECT unnest(...).
+    """
 
-        post_media = models.tweet_media.insert().values({"tweet_id": tweet.id, "media_id": media_id})
+    media_ids = list(dict.fromkeys(data.tweet_media_ids))
+    media_ids_param = bindparam("media_ids", media_ids, type_=ARRAY(Integer))
+    if media_ids:
+        # Уменьшенные копии прикрепляются только вместе с оригиналом
+        stmt = select(models.Media.id).where(models.Media.id == any_(media_ids_param), models.Media.parent_id.is_(None))
+        result = await session.execute(stmt)
+        missing = set(media_ids) - set(result.scalars().all())
+        if missing:
+            missing_ids = ", ".join(str(media_id) for media_id in media_ids if media_id in missing)
+            raise HTTPException(status_code=404, detail=f"media {missing_ids} not found")
+
+    stmt = insert(models.Tweet).values(user_id=user.id, post=data.tweet_data).returning(models.Tweet.id)
+    tweet_id = (await session.execute(stmt)).scalar_one()
+
+    if media_ids:
+        post_media = models.tweet_media.insert().from_select(
+            ["tweet_id", "media_id"],
+            select(literal(tweet_id, Integer), func.unnest(cast(media_ids_param, ARRAY(Integer)))),
+        )
         await session.execute(post_media)
 
     await session.commit()
+    await response_cache.invalidate(user.id)
+    await realtime.hub.publish({"type": "tweet.created", "tweet_id": tweet_id, "author_id": user.id})
+
+    if timeline.is_push_mode():
+        await timeline.fanout.submit(timeline.fanout_tweet, tweet_id)
 
     return {
         "result": True,
-        "tweet_id": tweet.id
+        "tweet_id": tweet_id
     }
 
 
@@ -58,179 +103,907 @@ async def post_medias(
 ):
     """
     Endpoint по загрузки медиа.
+
+    Файл сохраняется в хранилище под ключом по SHA-256 содержимого (ab/cd/<sha256>.<ext>);
+    повторная загрузка того же содержимого возвращает уже существующее медиа.
+    Уменьшенные копии изображений строятся в фоне после ответа.
     """
 
-    file_name = get_rnd_file_name_by_content_type(file.content_type)
-    file_path = os.path.join(settings.OUT_FILE_PATH, file_name)
     try:
-        async with async_open(file_path, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
+        tmp_path, size, sha256 = await stream_upload(
+            file, settings.OUT_FILE_PATH, settings.MEDIA_MAX_SIZE, settings.MEDIA_CHUNK_SIZE
+        )
+    except MediaTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
     except IOError as exc:
         raise HTTPException(status_code=500, detail=str(exc))
-    else:
-        media = models.Media(path=file_path)
-        session.add(media)
 
-    await session.commit()
+    try:
+        media_id = await _claim_media_by_hash(session, sha256)
+        if media_id is None:
+            key = media_key(sha256, extension_for_content_type(file.content_type))
+            await storage.put(tmp_path, key)
+
+            media = models.Media(path=key, size=size, sha256=sha256)
+            session.add(media)
+            try:
+                await session.commit()
+                media_id = media.id
+                if thumbnails.is_image(file.content_type):
+                    await thumbnails.variants_worker.submit(thumbnails.generate_variants, media_id)
+            except IntegrityError:
+                # тот же файл параллельно загружен другим запросом; файл по тому же ключу - его
+                await session.rollback()
+                res = await session.execute(select(models.Media.id, models.Media.path).filter_by(sha256=sha256))
+                media_id, winner_key = res.one()
+                if winner_key != key:
+                    await storage.delete(key)
+    finally:
+        await async_os.remove(tmp_path)
 
     return {
         "result": True,
-        "media_id": media.id,
+        "media_id": media_id,
+    }
+
+
+async def _claim_media_by_hash(session: AsyncSession, sha256: str) -> Optional[int]:
+    """
+    id уже загруженного медиа с тем же содержимым. created_at обновляется, чтобы сборщик
+    не удалил медиа до того, как его прикрепят к твиту: строка, которую сборщик удаляет
+    в этот момент, дождётся его фиксации и не будет найдена - тогда файл загружается заново.
+    """
+
+    res = await session.execute(
+        update(models.Media)
+        .where(models.Media.sha256 == sha256)
+        .values(created_at=func.now())
+        .returning(models.Media.id)
+    )
+    media_id = res.scalar_one_or_none()
+    await session.commit()
+    return media_id
+
+
+@media_router.get("/api/medias/{id}", response_class=MediaFileResponse, tags=["medias"])
+async def get_media(
+        request: Request,
+        media_id: int = Path(alias="id"),
+        session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Endpoint по отдаче медиа с поддержкой Range, ETag и If-None-Match.
+    """
+
+    res = await session.execute(select(models.Media.path, models.Media.sha256).filter_by(id=media_id))
+    media = res.one_or_none()
+    # Соединение с БД не должно оставаться занятым на время отдачи файла
+    await session.close()
+    if media is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    file_path = storage.local_path(media.path)
+    if file_path is None:
+        # Объектное хранилище отдаёт файл само, по временной подписанной ссылке
+        return RedirectResponse(await storage.url(media.path), status_code=307)
+
+    media_root = os.path.realpath(settings.OUT_FILE_PATH)
+    file_path = os.path.realpath(file_path)
+    if os.path.commonpath([file_path, media_root]) != media_root:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    try:
+        stat = await async_os.stat(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    if media.sha256:
+        etag = f'"{media.sha256}"'
+    else:
+        etag = f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    media_type, disposition = media_content_type(media.path)
+    headers = {
+        "etag": etag,
+        "cache-control": f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable",
+        "content-disposition": disposition,
+        "x-content-type-options": "nosniff",
     }
 
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # If-Range допускает только строгое сравнение: слабый ETag не гарантирует побайтового совпадения
+    if if_range is None or (not etag.startswith("W/") and if_range.strip() == etag):
+        try:
+            byte_range = parse_range(request.headers.get("range"), stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={"content-range": f"bytes */{stat.st_size}"})
+
+    return MediaFileResponse(
+        file_path,
+        stat.st_size,
+        media_type=media_type,
+        headers=headers,
+        byte_range=byte_range,
+    )
+
 
 @router.delete("/api/tweets/{id}", response_model=schemas.DefaultSuccessSchema, tags=["tweets"])
 async def delete_tweet(
-        user: models.User = Depends(get_crt_user),
-        tweet: models.Tweet = Depends(get_crt_tweet),
+        tweet_id: int = Path(alias="id"),
+        user: CurrentUser = Depends(get_crt_user),
         session: AsyncSession = Depends(get_session)
 ):
     """
     Endpoint по удалению твита.
+
+    Проверка автора и удаление выполняются одним запросом (DELETE ... RETURNING в CTE);
+    лайки, вложения и записи лент удаляются каскадом в БД. Медиа, которые могли
+    остаться без ссылок, ставятся в очередь на очистку.
     """
 
-    if user.id == tweet.user_id:
-        await session.delete(tweet)
-        await session.commit()
-    else:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    deleted = (
+        delete(models.Tweet)
+        .where(models.Tweet.id == tweet_id, models.Tweet.user_id == user.id)
+        .returning(models.Tweet.id)
+        .cte("deleted")
+    )
+    # Подзапрос видит снимок до удаления, то есть ещё не удалённые каскадом вложения
+    attached = (
+        select(func.array_agg(models.tweet_media.c.media_id))
+        .where(models.tweet_media.c.tweet_id == tweet_id)
+        .scalar_subquery()
+    )
+    res = await session.execute(select(deleted.c.id, attached))
+    row = res.first()
+
+    if row is None:
+        await session.rollback()
+        if await _tweet_exists(session, tweet_id):
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        raise HTTPException(status_code=404, detail="Tweet not found")
+
+    await session.commit()
+    await response_cache.invalidate(user.id)
+    await realtime.hub.publish({"type": "tweet.deleted", "tweet_id": tweet_id, "author_id": user.id})
+
+    media_ids = row[1]
+    if media_ids:
+        await media_gc.cleanup.submit(media_gc.collect_orphans, media_ids)
 
 
 @router.post("/api/tweets/{id}/likes", response_model=schemas.DefaultSuccessSchema, status_code=201, tags=["likes"])
 async def post_like(
-        tweet: models.Tweet = Depends(get_crt_tweet),
-        user: models.User = Depends(get_crt_user),
+        tweet_id: int = Path(alias="id"),
+        user: CurrentUser = Depends(get_crt_user),
         session: AsyncSession = Depends(get_session)
 ):
     """
     Endpoint по добавлению отметки "нравится".
+
+    Вставка отметки и увеличение счётчика выполняются одним запросом
+    (INSERT ... ON CONFLICT DO NOTHING в CTE), повторный запрос безопасен.
     """
 
-    stmt = select(models.Favorite).filter_by(user_id=user.id, tweet_id=tweet.id)
-    result = await session.execute(stmt)
-    favourite_exist = result.scalars().one_or_none()
+    inserted = (
+        pg_insert(models.Favorite)
+        .from_select(["user_id", "tweet_id"], select(literal(user.id, Integer), models.Tweet.id).where(models.Tweet.id == tweet_id))
+        .on_conflict_do_nothing()
+        .returning(models.Favorite.tweet_id)
+        .cte("inserted")
+    )
+    stmt = counters.like_count_delta(inserted.c.tweet_id, 1).returning(
+        models.Tweet.id, models.Tweet.user_id, models.Tweet.like_count
+    )
+    res = await session.execute(stmt)
+    liked = res.first()
 
-    if favourite_exist:
-        raise HTTPException(status_code=409, detail="Favourite already exists.")
-    else:
-        favourite = models.Favorite(user_id=user.id, tweet_id=tweet.id)
-        session.add(favourite)
-        await session.commit()
+    if liked is None:
+        await session.rollback()
+        if await _tweet_exists(session, tweet_id):
+            raise HTTPException(status_code=409, detail="Favourite already exists.")
+        raise HTTPException(status_code=404, detail="Tweet not found")
+
+    await session.commit()
+    await response_cache.invalidate(user.id)
+    await realtime.hub.publish(_like_event("tweet.liked", user.id, liked))
 
 
 @router.delete("/api/tweets/{id}/likes", response_model=schemas.DefaultSuccessSchema, tags=["likes"])
 async def delete_like(
-        favourite: models.Favorite = Depends(get_crt_favorite),
+        tweet_id: int = Path(alias="id"),
+        user: CurrentUser = Depends(get_crt_user),
         session: AsyncSession = Depends(get_session)
 ):
     """
     Endpoint по удалению отметки "Нравится".
     """
 
-    await session.delete(favourite)
+    deleted = (
+        delete(models.Favorite)
+        .filter_by(user_id=user.id, tweet_id=tweet_id)
+        .returning(models.Favorite.tweet_id)
+        .cte("deleted")
+    )
+    stmt = counters.like_count_delta(deleted.c.tweet_id, -1).returning(
+        models.Tweet.id, models.Tweet.user_id, models.Tweet.like_count
+    )
+    res = await session.execute(stmt)
+    unliked = res.first()
+
+    if unliked is None:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="Like not found")
+
+    await session.commit()
+    await response_cache.invalidate(user.id)
+    await realtime.hub.publish(_like_event("tweet.unliked", user.id, unliked))
+
+
+@router.post("/api/tweets/likes/batch", response_model=schemas.BatchResultSchemaOut, tags=["likes"])
+async def post_likes_batch(
+        data: schemas.BatchIdsSchemaIn,
+        user: CurrentUser = Depends(get_crt_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """
+    Endpoint по добавлению отметок "Нравится" сразу нескольким твитам.
+
+    Отметки и счётчики вставляются одним запросом на весь список. Для каждого id
+    возвращается статус, как у одиночного endpoint'а: 201, 409 (уже отмечен) или 404.
+    """
+
+    tweet_ids = list(dict.fromkeys(data.ids))
+    tweet_ids_param = bindparam("tweet_ids", tweet_ids, type_=ARRAY(Integer))
+    inserted = (
+        pg_insert(models.Favorite)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(literal(user.id, Integer), models.Tweet.id).where(models.Tweet.id == any_(tweet_ids_param)),
+        )
+        .on_conflict_do_nothing()
+        .returning(models.Favorite.tweet_id)
+        .cte("inserted")
+    )
+    stmt = counters.like_count_delta(inserted.c.tweet_id, 1).returning(
+        models.Tweet.id, models.Tweet.user_id, models.Tweet.like_count
+    )
+    liked = (await session.execute(stmt)).all()
+    created = {row.id for row in liked}
+
+    existing = set()
+    if len(created) < len(tweet_ids):
+        res = await session.execute(select(models.Tweet.id).where(models.Tweet.id == any_(tweet_ids_param)))
+        existing = set(res.scalars().all())
+
     await session.commit()
+    if created:
+        await response_cache.invalidate(user.id)
+    for row in liked:
+        await realtime.hub.publish(_like_event("tweet.liked", user.id, row))
+
+    return _batch_result(tweet_ids, created, existing)
 
 
 @router.post("/api/users/{id}/follow", response_model=schemas.DefaultSuccessSchema, status_code=201, tags=["follow"])
 async def post_follow(
         following_id: int = Path(alias="id"),
-        user: models.User = Depends(get_crt_user),
+        user: CurrentUser = Depends(get_crt_user),
         session: AsyncSession = Depends(get_session)
 ):
     """
     Endpoint по созданию подписки на пользователя.
+
+    Вставка подписки и обновление счётчиков выполняются одним запросом
+    (INSERT ... ON CONFLICT DO NOTHING в CTE), повторный запрос безопасен.
     """
 
-    user_stmt = select(models.User).filter_by(id=following_id)
-    following_stmt = select(models.user_following).filter_by(user_id=user.id, following_id=following_id)
+    if following_id == user.id:
+        raise HTTPException(status_code=409, detail="User can't follow himself.")
 
-    user_res = await session.execute(user_stmt)
-    following_res = await session.execute(following_stmt)
-    following_user = user_res.scalars().one_or_none()
-    following = following_res.scalars().one_or_none()
+    inserted = (
+        pg_insert(models.user_following)
+        .from_select(
+            ["user_id", "following_id"],
+            select(literal(user.id, Integer), models.User.id).where(models.User.id == following_id),
+        )
+        .on_conflict_do_nothing()
+        .returning(models.user_following.c.following_id)
+        .cte("inserted")
+    )
+    stmt = counters.follow_counts_delta(user.id, inserted.c.following_id, 1).returning(models.User.id)
+    res = await session.execute(stmt)
 
-    if not following_user:
+    if res.first() is None:
+        await session.rollback()
+        if await _user_exists(session, following_id):
+            raise HTTPException(status_code=409, detail="Following already exists.")
         raise HTTPException(status_code=404, detail="Following user not found")
-    elif following_id == user.id:
-        raise HTTPException(status_code=409, detail="User can't follow himself.")
-    elif following:
-        raise HTTPException(status_code=409, detail="Following already exists.")
-    else:
-        user_following = models.user_following.insert().values({"user_id": user.id, "following_id": following_id})
-        await session.execute(user_following)
-        await session.commit()
+
+    await session.commit()
+    await response_cache.invalidate(user.id, following_id)
+    await realtime.hub.publish({"type": "follow.created", "user_id": user.id, "following_id": following_id})
+
+    if timeline.is_push_mode():
+        await timeline.fanout.submit(timeline.backfill_follow, user.id, following_id)
 
 
 @router.delete("/api/users/{id}/follow", response_model=schemas.DefaultSuccessSchema, tags=["follow"])
 async def delete_follow(
         following_id: int = Path(alias="id"),
-        user: models.User = Depends(get_crt_user),
+        user: CurrentUser = Depends(get_crt_user),
         session: AsyncSession = Depends(get_session)
 ):
     """
     Endoint по удалению подписки с пользователя.
     """
 
-    stmt = select(models.user_following).filter_by(user_id=user.id, following_id=following_id)
-    res = await session.execute(stmt)
-    following = res.scalars().one_or_none()
-
-    if following:
-        delete_stmt = delete(models.user_following).where(
+    deleted = (
+        delete(models.user_following)
+        .where(
             models.user_following.c.user_id == user.id,
             models.user_following.c.following_id == following_id
         )
+        .returning(models.user_following.c.following_id)
+        .cte("deleted")
+    )
+    stmt = counters.follow_counts_delta(user.id, deleted.c.following_id, -1).returning(
+        models.User.id, models.User.follower_count
+    )
+    follower_counts = dict((await session.execute(stmt)).all())
+
+    if not follower_counts:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="Following not found")
 
-        await session.execute(delete_stmt)
-        await session.commit()
+    if timeline.is_push_mode():
+        await timeline.prune_follow(session, user.id, following_id)
+    await session.commit()
+    await response_cache.invalidate(user.id, following_id)
+    await realtime.hub.publish({"type": "follow.deleted", "user_id": user.id, "following_id": following_id})
 
-    else:
-        raise HTTPException(status_code=404, detail="Following not found")
+    # Автор опустился до порога раздачи: его твиты больше не подмешиваются при чтении
+    if timeline.is_push_mode() and follower_counts.get(following_id) == settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+        await timeline.fanout.submit(timeline.backfill_author, following_id)
+
+
+@router.post("/api/users/follow/batch", response_model=schemas.BatchResultSchemaOut, tags=["follow"])
+async def post_follow_batch(
+        data: schemas.BatchIdsSchemaIn,
+        user: CurrentUser = Depends(get_crt_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """
+    Endpoint по созданию подписок сразу на нескольких пользователей.
+
+    Подписки и счётчики обоих сторон обновляются одним запросом на весь список. Для каждого
+    id возвращается статус, как у одиночного endpoint'а: 201, 409 (уже подписан или это
+    сам пользователь) или 404.
+    """
+
+    following_ids = list(dict.fromkeys(data.ids))
+    following_ids_param = bindparam("following_ids", following_ids, type_=ARRAY(Integer))
+    inserted = (
+        pg_insert(models.user_following)
+        .from_select(
+            ["user_id", "following_id"],
+            select(literal(user.id, Integer), models.User.id).where(
+                models.User.id == any_(following_ids_param), models.User.id != user.id
+            ),
+        )
+        .on_conflict_do_nothing()
+        .returning(models.user_following.c.following_id)
+        .cte("inserted")
+    )
+    stmt = counters.follow_counts_batch_delta(user.id, select(inserted.c.following_id), 1).returning(models.User.id)
+    created = set((await session.execute(stmt)).scalars().all()) - {user.id}
+
+    existing = set()
+    if len(created) < len(following_ids):
+        res = await session.execute(select(models.User.id).where(models.User.id == any_(following_ids_param)))
+        existing = set(res.scalars().all())
+
+    await session.commit()
+    if created:
+        await response_cache.invalidate(user.id, *created)
+    for following_id in created:
+        await realtime.hub.publish({"type": "follow.created", "user_id": user.id, "following_id": following_id})
+
+    if timeline.is_push_mode():
+        for following_id in created:
+            await timeline.fanout.submit(timeline.backfill_follow, user.id, following_id)
 
+    return _batch_result(following_ids, created, existing)
+
+
+def _like_event(kind: str, user_id: int, tweet) -> dict:
+    return {
+        "type": kind,
+        "tweet_id": tweet.id,
+        "author_id": tweet.user_id,
+        "user_id": user_id,
+        "like_count": tweet.like_count,
+    }
+
+
+def _batch_result(ids: List[int], created: Set[int], existing: Set[int]) -> dict:
+    """
+    Статусы элементов batch-запроса: 201 - создано, 409 - уже было, 404 - не найдено.
+    """
+
+    def status(item_id: int) -> int:
+        if item_id in created:
+            return 201
+        return 409 if item_id in existing else 404
+
+    return {
+        "result": True,
+        "items": [{"id": item_id, "status": status(item_id)} for item_id in ids],
+    }
 
-@router.get("/api/tweets", response_model=schemas.FeedSchemaOut, tags=["tweets"])
+
+async def _tweet_exists(session: AsyncSession, tweet_id: int) -> bool:
+    res = await session.execute(select(exists().where(models.Tweet.id == tweet_id)))
+    return res.scalar()
+
+
+async def _user_exists(session: AsyncSession, user_id: int) -> bool:
+    res = await session.execute(select(exists().where(models.User.id == user_id)))
+    return res.scalar()
+
+
+@router.get(
+    "/api/tweets",
+    response_model=Union[schemas.FeedSchemaOut, schemas.FeedCountsSchemaOut],
+    tags=["tweets"],
+)
 async def get_tweets(
-        user: models.User = Depends(get_crt_user),
+        limit: int = Query(default=settings.FEED_PAGE_SIZE, ge=1, le=settings.FEED_MAX_PAGE_SIZE),
+        before_id: Optional[int] = Query(default=None),
+        cursor: Optional[str] = Query(default=None),
+        counts: bool = Query(default=False),
+        media_width: int = Query(default=settings.FEED_MEDIA_WIDTH, ge=1),
+        if_none_match: Optional[str] = Header(default=None),
+        user: CurrentUser = Depends(get_crt_user),
+        session: AsyncSession = Depends(get_read_session)
 ):
     """
     Endpoint по генерации ленты с твитами в соответствии с подписками пользователя.
+
+    Лента отдаётся постранично (keyset): следующая страница запрашивается
+    по `next_cursor` из ответа либо по `before_id` последнего полученного твита.
+    С `counts=true` вместо списка лайкнувших возвращается их количество.
+    Вложения ссылаются на наименьшую копию изображения не уже `media_width` пикселей.
+
+    Страница кэшируется с ключом по версии пользователя: собственные записи видны
+    сразу, чужие твиты и лайки - не позже, чем через FEED_CACHE_TTL.
+
+    Ответ содержит слабый ETag; при совпадении If-None-Match возвращается 304,
+    а твиты страницы со связями не загружаются.
     """
 
-    feed = []
-    for flw_user in user.following:
-        feed.extend(flw_user.tweets)
-    feed.sort(key=lambda x: x.created_at, reverse=True)
+    # Позиция страницы - последняя и с меткой вида: курсор и before_id с одинаковым
+    # текстом или пустой курсор не совпадают в ключе с другими страницами
+    if cursor is not None:
+        page = ("c", cursor)
+    elif before_id is not None:
+        page = ("b", before_id)
+    else:
+        page = ("first",)
+    params = (limit, counts, media_width, *page)
+    cache_key = await response_cache.key("feed", user.id, *params)
+    cached = await response_cache.get_tagged(cache_key)
+    if cached is not None:
+        etag, body = cached
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return DefaultResponse(body, headers=revalidation_headers(etag))
+
+    before = None
+    if cursor is not None:
+        try:
+            before = decode_feed_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    elif before_id is not None:
+        before_tweet = aliased(models.Tweet)
+        before = (select(before_tweet.created_at).filter_by(id=before_id).scalar_subquery(), before_id)
+
+    window = timeline.feed_window(user.id, limit, before)
+    if if_none_match:
+        versions = (await session.execute(timeline.window_versions(window))).all()
+        etag = _feed_etag(user.id, params, versions)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    stmt = (
+        select(models.Tweet)
+        .join(window, window.c.id == models.Tweet.id)
+        .order_by(window.c.created_at.desc(), window.c.id.desc())
+        .options(*_tweet_loader_options(counts))
+    )
+    res = await session.execute(stmt)
+    feed = res.scalars().all()
+    # Маркеры берутся из загруженных твитов: ETag не новее тела ответа
+    etag = _feed_etag(user.id, params, [(tweet.id, tweet.updated_at) for tweet in feed])
+
+    next_cursor = None
+    if len(feed) == limit:
+        next_cursor = encode_feed_cursor(feed[-1].created_at, feed[-1].id)
 
-    return {
+    content = {
+        "result": True,
+        "tweets": [schemas.tweet_to_dict(tweet, counts, media_width) for tweet in feed],
+        "next_cursor": next_cursor,
+    }
+    response = _trusted_response(content, schemas.FeedCountsSchemaOut if counts else schemas.FeedSchemaOut)
+    response.headers.update(revalidation_headers(etag))
+    await response_cache.set_tagged(cache_key, etag, response.body, settings.FEED_CACHE_TTL)
+    return response
+
+
+def _feed_etag(user_id: int, params: tuple, versions) -> str:
+    """
+    ETag страницы ленты: параметры запроса и пары (id, updated_at) её твитов. Состав
+    страницы меняют новые и удалённые твиты и подписки, updated_at - лайки и готовые
+    уменьшенные копии медиа.
+    """
+
+    return weak_etag("feed", user_id, *params, *sorted((tweet_id, updated_at) for tweet_id, updated_at in versions))
+
+
+@router.get(
+    "/api/tweets/search",
+    response_model=Union[schemas.FeedSchemaOut, schemas.FeedCountsSchemaOut],
+    tags=["tweets"],
+)
+async def search_tweets(
+        q: str = Query(min_length=1, max_length=settings.SEARCH_QUERY_MAX_LENGTH),
+        author_id: Optional[int] = Query(default=None),
+        since: Optional[datetime] = Query(default=None),
+        until: Optional[datetime] = Query(default=None),
+        limit: int = Query(default=settings.FEED_PAGE_SIZE, ge=1, le=settings.FEED_MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(default=None),
+        counts: bool = Query(default=False),
+        media_width: int = Query(default=settings.FEED_MEDIA_WIDTH, ge=1),
+        user: CurrentUser = Depends(get_crt_user),
+        session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Endpoint полнотекстового поиска по твитам.
+
+    Запрос - слова через пробел, "точная фраза", OR и -исключение (websearch_to_tsquery).
+    Твиты отдаются по убыванию релевантности, постранично по `next_cursor`;
+    `author_id`, `since` и `until` сужают поиск автором и временем публикации.
+    """
+
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_search_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    window = search.search_window(q, limit, author_id, since, until, after)
+    stmt = (
+        select(models.Tweet, window.c.rank)
+        .join(window, window.c.id == models.Tweet.id)
+        .order_by(window.c.rank.desc(), window.c.id.desc())
+        .options(*_tweet_loader_options(counts))
+    )
+    res = await session.execute(stmt)
+    found = res.all()
+
+    next_cursor = None
+    if len(found) == limit:
+        next_cursor = encode_search_cursor(found[-1].rank, found[-1].Tweet.id)
+
+    content = {
         "result": True,
-        "tweets": [json.loads(schemas.TweetSchemaIn.from_orm(tweet).json(models_as_dict=False)) for tweet in feed],
+        "tweets": [schemas.tweet_to_dict(row.Tweet, counts, media_width) for row in found],
+        "next_cursor": next_cursor,
     }
+    return _trusted_response(content, schemas.FeedCountsSchemaOut if counts else schemas.FeedSchemaOut)
+
+
+def _tweet_loader_options(counts: bool) -> tuple:
+    """
+    Загрузка связей твитов страницы (ленты, поиска) фиксированным числом запросов.
+    С counts список лайкнувших не загружается.
+    """
+
+    if counts:
+        favorites_loader = raiseload(models.Tweet.favorites)
+    else:
+        favorites_loader = selectinload(models.Tweet.favorites).joinedload(models.Favorite.user).raiseload("*")
+
+    return (
+        joinedload(models.Tweet.user).raiseload("*"),
+        selectinload(models.Tweet.media).selectinload(models.Media.variants).raiseload("*"),
+        favorites_loader,
+    )
+
 
+@router.get("/api/tweets/{id}/likes", response_model=schemas.UserListSchemaOut, tags=["likes"])
+async def get_likes(
+        tweet_id: int = Path(alias="id"),
+        limit: int = Query(default=settings.FEED_PAGE_SIZE, ge=1, le=settings.FEED_MAX_PAGE_SIZE),
+        before_id: Optional[int] = Query(default=None),
+        session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Endpoint со списком пользователей, отметивших твит, постранично по убыванию id.
+    """
+
+    stmt = (
+        select(models.User.id, models.User.username)
+        .join(models.Favorite, models.Favorite.user_id == models.User.id)
+        .where(models.Favorite.tweet_id == tweet_id)
+    )
+    return await _user_list_page(session, stmt, models.Favorite.user_id, limit, before_id)
 
-@router.get("/api/users/me", response_model=schemas.PageSchema, tags=["users"])
+
+@router.get("/api/stream", response_class=StreamingResponse, tags=["stream"])
+async def stream_events(
+        user: CurrentUser = Depends(get_crt_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """
+    Поток событий ленты в формате Server-Sent Events вместо опроса GET /api/tweets.
+
+    События: tweet.created, tweet.deleted, tweet.liked, tweet.unliked (по авторам, на которых
+    подписан пользователь), follow.created, follow.deleted (его собственные подписки) и resync -
+    клиент пропустил события и должен заново запросить ленту. Без событий раз в
+    REALTIME_HEARTBEAT секунд приходит комментарий, поддерживающий соединение.
+    """
+
+    following = await _following_ids(session, user.id)
+    # Соединение с БД не должно оставаться занятым на всё время потока
+    await session.close()
+
+    async def events():
+        async with realtime.hub.subscribe(user.id, following) as subscription:
+            yield b": connected\n\n"
+            while True:
+                event = await subscription.get(settings.REALTIME_HEARTBEAT)
+                if event is None:
+                    yield b": heartbeat\n\n"
+                else:
+                    yield b"event: %s\ndata: %s\n\n" % (event["type"].encode(), orjson.dumps(event))
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/api/stream/ws")
+async def stream_events_ws(
+        websocket: WebSocket,
+        api_key_header: Optional[str] = Header(default=None, alias="api-key"),
+        api_key: Optional[str] = Query(default=None),
+        session: AsyncSession = Depends(get_session)
+):
+    """
+    Те же события, что и в /api/stream, через WebSocket: по одному JSON-сообщению на событие,
+    без событий - {"type": "heartbeat"}. Браузер не может задать заголовок при установке
+    соединения, поэтому ключ принимается и параметром `api_key`.
+    """
+
+    user = await resolve_api_key(session, api_key_header or api_key)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    following = await _following_ids(session, user.id)
+    await session.close()
+    await websocket.accept()
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    disconnected = asyncio.create_task(wait_disconnect())
+    try:
+        async with realtime.hub.subscribe(user.id, following) as subscription:
+            while not disconnected.done():
+                event = asyncio.create_task(subscription.queue.get())
+                done, _ = await asyncio.wait(
+                    {event, disconnected}, timeout=settings.REALTIME_HEARTBEAT, return_when=asyncio.FIRST_COMPLETED
+                )
+                if event not in done:
+                    event.cancel()
+                    if disconnected in done:
+                        break
+                await websocket.send_text(orjson.dumps(event.result() if event in done else {"type": "heartbeat"}).decode())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        disconnected.cancel()
+
+
+async def _following_ids(session: AsyncSession, user_id: int) -> List[int]:
+    res = await session.execute(
+        select(models.user_following.c.following_id).where(models.user_following.c.user_id == user_id)
+    )
+    return res.scalars().all()
+
+
+@router.get("/api/users/me", response_model=Union[schemas.PageSchema, schemas.PageCountsSchema], tags=["users"])
 async def get_me(
-        user: models.User = Depends(get_crt_user)
+        counts: bool = Query(default=False),
+        api_key: str = Header(default=None, alias="api-key"),
+        if_none_match: Optional[str] = Header(default=None),
+        user: CurrentUser = Depends(get_crt_user),
+        session: AsyncSession = Depends(get_read_session)
 ):
     """
     Endpoint с информацией о профиле текущего пользователя.
     """
 
+    response = await _profile_response(session, user.id, counts, if_none_match)
+    if response is None:
+        invalidate_api_key(api_key)
+        raise HTTPException(status_code=401, detail='Unauthorized')
+    return response
+
+
+@router.get("/api/users/{id}", response_model=Union[schemas.PageSchema, schemas.PageCountsSchema], tags=["users"])
+async def get_user(
+        user_id: int = Path(alias="id"),
+        counts: bool = Query(default=False),
+        if_none_match: Optional[str] = Header(default=None),
+        session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Endpoint с информацией о профиле заданного пользователя.
+    """
+
+    response = await _profile_response(session, user_id, counts, if_none_match)
+    if response is None:
+        raise HTTPException(status_code=404, detail='User not found')
+    return response
+
+
+@router.get("/api/users", response_model=schemas.UserBatchSchemaOut, tags=["users"])
+async def get_users(
+        ids: str = Query(description="id пользователей через запятую"),
+        session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Endpoint с краткими карточками (имя, число подписчиков и подписок) нескольких
+    пользователей одним запросом. Пользователи возвращаются в порядке `ids`,
+    ненайденные id перечисляются в `not_found`.
+    """
+
+    try:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in ids.split(",")))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids should be a comma-separated list of integers")
+    if len(user_ids) > settings.BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"at most {settings.BATCH_MAX_SIZE} ids are allowed")
+
+    stmt = select(
+        models.User.id, models.User.username, models.User.follower_count, models.User.following_count
+    ).where(models.User.id == any_(bindparam("user_ids", user_ids, type_=ARRAY(Integer))))
+    found = {user.id: user for user in (await session.execute(stmt)).all()}
+
     return {
         "result": True,
-        "user": schemas.UserSchema.from_orm(user).dict(by_alias=True)
+        "users": [
+            schemas.UserCountsSchema.from_orm(found[user_id]).dict(by_alias=True)
+            for user_id in user_ids if user_id in found
+        ],
+        "not_found": [user_id for user_id in user_ids if user_id not in found],
     }
 
 
-@router.get("/api/users/{id}", response_model=schemas.PageSchema, tags=["users"])
-async def get_user(
-        user: models.User = Depends(get_user_by_id)
+@router.get("/api/users/{id}/followers", response_model=schemas.UserListSchemaOut, tags=["follow"])
+async def get_followers(
+        user_id: int = Path(alias="id"),
+        limit: int = Query(default=settings.FEED_PAGE_SIZE, ge=1, le=settings.FEED_MAX_PAGE_SIZE),
+        before_id: Optional[int] = Query(default=None),
+        session: AsyncSession = Depends(get_read_session)
 ):
     """
-    Endpoint с информацией о профиле заданного пользователя.
+    Endpoint со списком подписчиков пользователя, постранично по убыванию id.
     """
 
+    stmt = (
+        select(models.User.id, models.User.username)
+        .join(models.user_following, models.user_following.c.user_id == models.User.id)
+        .where(models.user_following.c.following_id == user_id)
+    )
+    return await _user_list_page(session, stmt, models.user_following.c.user_id, limit, before_id)
+
+
+@router.get("/api/users/{id}/following", response_model=schemas.UserListSchemaOut, tags=["follow"])
+async def get_following(
+        user_id: int = Path(alias="id"),
+        limit: int = Query(default=settings.FEED_PAGE_SIZE, ge=1, le=settings.FEED_MAX_PAGE_SIZE),
+        before_id: Optional[int] = Query(default=None),
+        session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Endpoint со списком подписок пользователя, постранично по убыванию id.
+    """
+
+    stmt = (
+        select(models.User.id, models.User.username)
+        .join(models.user_following, models.user_following.c.following_id == models.User.id)
+        .where(models.user_following.c.user_id == user_id)
+    )
+    return await _user_list_page(session, stmt, models.user_following.c.following_id, limit, before_id)
+
+
+def _trusted_response(content: dict, model: Type[BaseModel]) -> DefaultResponse:
+    """
+    Ответ, собранный быстрым путём, без повторной валидации по response_model.
+    При VALIDATE_RESPONSES содержимое всё же проверяется схемой.
+    """
+
+    if settings.VALIDATE_RESPONSES:
+        model.parse_obj(content)
+    return DefaultResponse(content)
+
+
+async def _profile_response(
+        session: AsyncSession, user_id: int, counts: bool, if_none_match: Optional[str] = None
+) -> Optional[Response]:
+    """
+    Профиль пользователя из кэша ответов; при промахе загружается из БД и кэшируется.
+    Возвращает None, если пользователь не найден.
+
+    При совпадении If-None-Match с ETag профиля возвращается 304: версия проверяется
+    по updated_at и graph_version пользователя, подписки и подписчики не загружаются.
+    """
+
+    cache_key = await response_cache.key("profile", user_id, counts)
+    cached = await response_cache.get_tagged(cache_key)
+    if cached is not None:
+        etag, body = cached
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return DefaultResponse(body, headers=revalidation_headers(etag))
+
+    if if_none_match:
+        stmt = select(models.User.updated_at, models.User.graph_version).filter_by(id=user_id)
+        version = (await session.execute(stmt)).one_or_none()
+        if version is None:
+            return None
+        etag = _profile_etag(user_id, counts, *version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    user = await load_user_profile(session, user_id, counts)
+    if user is None:
+        return None
+    etag = _profile_etag(user_id, counts, user.updated_at, user.graph_version)
+
+    user_schema = schemas.UserCountsSchema if counts else schemas.UserSchema
+    content = {
+        "result": True,
+        "user": user_schema.from_orm(user).dict(by_alias=True)
+    }
+    response = DefaultResponse(content, headers=revalidation_headers(etag))
+    await response_cache.set_tagged(cache_key, etag, response.body, settings.PROFILE_CACHE_TTL)
+    return response
+
+
+def _profile_etag(user_id: int, counts: bool, updated_at: datetime, graph_version: int) -> str:
+    return weak_etag("profile", user_id, counts, updated_at, graph_version)
+
+
+async def _user_list_page(session: AsyncSession, stmt, id_column, limit: int, before_id: Optional[int]) -> dict:
+    if before_id is not None:
+        stmt = stmt.where(id_column < before_id)
+
+    res = await session.execute(stmt.order_by(id_column.desc()).limit(limit))
+    users = res.all()
+
     return {
         "result": True,
-        "user": schemas.UserSchema.from_orm(user).dict(by_alias=True)
+        "users": [schemas.AuthorSchema.from_orm(user).dict(by_alias=True) for user in users],
+        "next_before_id": users[-1].id if len(users) == limit else None,
     }
@@ -1,6 +1,8 @@
 from __future__ import annotations
 from pydantic import BaseModel, Field, ValidationError, validator
-from typing import List
+from typing import List, Optional
+
+from app.config import settings
 
 
 class PostTweetSchema(BaseModel):
@@ -9,11 +11,19 @@ class PostTweetSchema(BaseModel):
 
 
 class MediaSchema(BaseModel):
-    path: str
+    id: int
 
     class Config:
         orm_mode = True
 
+    @property
+    def url(self) -> str:
+        return self.url_for(self.id)
+
+    @staticmethod
+    def url_for(media_id: int) -> str:
+        return f"/api/medias/{media_id}"
+
 
 class AuthorSchema(BaseModel):
     id: int
@@ -29,6 +39,11 @@ class UserSchema(AuthorSchema):
     following: List[AuthorSchema]
 
 
+class UserCountsSchema(AuthorSchema):
+    follower_count: int
+    following_count: int
+
+
 class FavoriteSchemaIn(BaseModel):
     user: AuthorSchema
 
@@ -53,11 +68,50 @@ class TweetSchemaIn(TweetSchema):
     class Config:
         orm_mode = True
         json_encoders = {
-            MediaSchema: lambda m: m.path,
+            MediaSchema: lambda m: m.url,
             FavoriteSchemaIn: lambda f: f.user.dict()
         }
 
 
+def smallest_suitable(media, width: int):
+    """
+    Наименьшая копия медиа не уже `width` пикселей, иначе наибольшая копия. Оригинал -
+    только пока копий нет: в нём могут быть EXIF с координатами съёмки.
+    """
+
+    variants = [variant for variant in media.variants if variant.width is not None]
+    suitable = [variant for variant in variants if variant.width >= width]
+    if suitable:
+        return min(suitable, key=lambda variant: variant.width)
+    return max(variants, key=lambda variant: variant.width, default=media)
+
+
+def tweet_to_dict(tweet, counts: bool = False, media_width: Optional[int] = None) -> dict:
+    """
+    Быстрая сериализация твита в формат TweetSchemaOut (TweetCountsSchemaOut при counts)
+    за один проход по ORM-объекту, без промежуточных pydantic-моделей и JSON.
+
+    При media_width вложения ссылаются на наименьшую подходящую уменьшенную копию.
+    """
+
+    if media_width is None:
+        attachments = [MediaSchema.url_for(media.id) for media in tweet.media]
+    else:
+        attachments = [MediaSchema.url_for(smallest_suitable(media, media_width).id) for media in tweet.media]
+
+    item = {
+        "id": tweet.id,
+        "content": tweet.post,
+        "attachments": attachments,
+        "author": {"id": tweet.user.id, "name": tweet.user.username},
+    }
+    if counts:
+        item["likes_count"] = tweet.like_count
+    else:
+        item["likes"] = [{"user_id": fav.user.id, "name": fav.user.username} for fav in tweet.favorites]
+    return item
+
+
 class TweetSchemaOut(TweetSchema):
     content: str
     attachments: List[str]
@@ -65,6 +119,13 @@ class TweetSchemaOut(TweetSchema):
     likes: List[FavoriteSchemaOut]
 
 
+class TweetCountsSchemaOut(TweetSchema):
+    content: str
+    attachments: List[str]
+    author: AuthorSchema
+    likes_count: int
+
+
 class DefaultSuccessSchema(BaseModel):
     result: bool = True
 
@@ -77,12 +138,45 @@ class DefaultSuccessSchema(BaseModel):
 
 class FeedSchemaOut(DefaultSuccessSchema):
     tweets: List[TweetSchemaOut]
+    next_cursor: Optional[str] = None
+
+
+class FeedCountsSchemaOut(DefaultSuccessSchema):
+    tweets: List[TweetCountsSchemaOut]
+    next_cursor: Optional[str] = None
 
 
 class PageSchema(DefaultSuccessSchema):
     user: UserSchema
 
 
+class PageCountsSchema(DefaultSuccessSchema):
+    user: UserCountsSchema
+
+
+class UserListSchemaOut(DefaultSuccessSchema):
+    users: List[AuthorSchema]
+    next_before_id: Optional[int] = None
+
+
+class BatchIdsSchemaIn(BaseModel):
+    ids: List[int] = Field(min_items=1, max_items=settings.BATCH_MAX_SIZE)
+
+
+class BatchItemSchema(BaseModel):
+    id: int
+    status: int
+
+
+class BatchResultSchemaOut(DefaultSuccessSchema):
+    items: List[BatchItemSchema]
+
+
+class UserBatchSchemaOut(DefaultSuccessSchema):
+    users: List[UserCountsSchema]
+    not_found: List[int]
+
+
 class PostTweetResponseSchema(DefaultSuccessSchema):
     tweet_id: int
 
@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import Float, Integer, func, literal, literal_column, select, tuple_
+from sqlalchemy.sql import ColumnElement, Subquery
+
+from app import models
+
+
+def tweet_query(text: str) -> ColumnElement:
+    """
+    tsquery из строки поиска в синтаксисе websearch_to_tsquery: слова через пробел,
+    "точная фраза", OR и -исключение. Некорректный ввод не вызывает ошибку.
+    """
+
+    return func.websearch_to_tsquery(literal_column(f"'{models.TWEET_SEARCH_CONFIG}'::regconfig"), text)
+
+
+def search_window(
+        text: str,
+        limit: int,
+        author_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[float, int]] = None,
+) -> Subquery:
+    """
+    Подзапрос (id, rank) твитов одной страницы поиска по убыванию релевантности.
+
+    Совпадения находятся по GIN-индексу tweet.search_vector; ранжируются только они,
+    поэтому время запроса зависит от числа совпадений, а не от размера таблицы.
+    Страницы - keyset по (rank, id), `after` - (rank, id) последнего твита предыдущей.
+    """
+
+    tweet = models.Tweet
+    query = tweet_query(text)
+    rank = func.ts_rank(tweet.search_vector, query)
+
+    stmt = select(tweet.id, rank.label("rank")).where(tweet.search_vector.op("@@")(query))
+    if author_id is not None:
+        stmt = stmt.where(tweet.user_id == author_id)
+    if since is not None:
+        stmt = stmt.where(tweet.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(tweet.created_at < until)
+    if after is not None:
+        stmt = stmt.where(tuple_(rank, tweet.id) < tuple_(literal(after[0], Float), literal(after[1], Integer)))
+
+    return stmt.order_by(rank.desc(), tweet.id.desc()).limit(limit).subquery()
@@ -0,0 +1,223 @@
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+from contextlib import AsyncExitStack
+from typing import Optional, Tuple
+
+from aiofiles import open as async_open
+from aiofiles import os as async_os
+from aiofiles.os import wrap
+
+from app.config import settings
+
+
+_copyfile = wrap(shutil.copyfile)
+_link = wrap(os.link)
+
+
+def media_key(sha256: str, extension: str) -> str:
+    """
+    Ключ медиа в хранилище: адресация по содержимому с разбиением по префиксу хэша
+    (ab/cd/<sha256>.<ext>), чтобы ни в одном каталоге не было миллионов файлов.
+    """
+
+    extension = re.sub(r"[^a-z0-9]", "", extension.lower())[:16] or "bin"
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}"
+
+
+def variant_key(sha256: str, variant: str, extension: str) -> str:
+    """
+    Ключ уменьшенной копии: рядом с оригиналом, с именем варианта перед расширением.
+    """
+
+    return media_key(sha256, extension).replace(f"{sha256}.", f"{sha256}.{variant}.", 1)
+
+
+def is_sharded_key(key: str) -> bool:
+    return re.fullmatch(r"[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9_]+)?\.[a-z0-9]+", key) is not None
+
+
+def media_content_type(key: str) -> Tuple[str, str]:
+    """
+    Content-Type и Content-Disposition для отдачи медиа. Расширение в ключе задаёт
+    загрузивший клиент, поэтому показывать в браузере можно только типы из
+    MEDIA_INLINE_TYPES: загруженный html или svg на домене API был бы хранимым XSS.
+    """
+
+    media_type = mimetypes.guess_type(key)[0]
+    if media_type in settings.MEDIA_INLINE_TYPES:
+        return media_type, "inline"
+    return "application/octet-stream", "attachment"
+
+
+def extension_for_content_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split("/")[-1]
+
+
+class LocalStorage:
+    """
+    Хранилище медиа в каталоге OUT_FILE_PATH.
+
+    Абсолютные пути в Media.path - файлы, загруженные до перехода на ключи
+    (см. scripts/rehome_media.py); они читаются и удаляются как есть.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.root, key)
+
+    async def url(self, key: str) -> Optional[str]:
+        return None
+
+    async def exists(self, key: str) -> bool:
+        return await async_os.path.exists(self.local_path(key))
+
+    async def read(self, key: str) -> bytes:
+        async with async_open(self.local_path(key), "rb") as f:
+            return await f.read()
+
+    async def put(self, src_path: str, key: str) -> None:
+        """
+        Сохранение копии локального файла под ключом. Файл появляется под
+        итоговым именем атомарно, частично записанный файл не виден читателям.
+        """
+
+        dst_path = self.local_path(key)
+        await async_os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        tmp_path = f"{dst_path}.{uuid.uuid4().hex}.part"
+        try:
+            await _link(src_path, tmp_path)
+        except OSError:
+            await _copyfile(src_path, tmp_path)
+        await async_os.replace(tmp_path, dst_path)
+
+    async def delete(self, key: str) -> int:
+        """
+        Удаление файла; возвращает число освобождённых байт (0, если файла нет).
+        """
+
+        path = self.local_path(key)
+        try:
+            stat = await async_os.stat(path)
+            await async_os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return stat.st_size
+
+
+class S3Storage(LocalStorage):
+    """
+    Хранилище медиа в S3-совместимом объектном хранилище (AWS S3, MinIO, Ceph, ...).
+
+    Клиент aiobotocore создаётся в `start` (нужен extra 's3'); вместо него можно передать
+    любой объект с теми же асинхронными методами (get_object, put_object, head_object,
+    delete_object, generate_presigned_url). Файлы, загруженные до перехода на ключи, остаются локальными.
+    """
+
+    def __init__(self, root: str, bucket: str, prefix: str = "", client=None):
+        super().__init__(root)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+        self._stack: Optional[AsyncExitStack] = None
+
+    async def start(self) -> None:
+        if self.client is not None:
+            return
+
+        try:
+            from aiobotocore.session import get_session
+        except ImportError:
+            raise RuntimeError("MEDIA_STORAGE=s3 requires the 's3' extra to be installed")
+
+        self._stack = AsyncExitStack()
+        self.client = await self._stack.enter_async_context(
+            get_session().create_client(
+                "s3",
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                region_name=settings.S3_REGION,
+                aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            )
+        )
+
+    async def stop(self) -> None:
+        if self._stack is not None:
+            await self._stack.aclose()
+            self._stack = None
+            self.client = None
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def local_path(self, key: str) -> Optional[str]:
+        return key if os.path.isabs(key) else None
+
+    async def url(self, key: str) -> Optional[str]:
+        media_type, disposition = media_content_type(key)
+        return await self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.object_key(key),
+                "ResponseContentType": media_type,
+                "ResponseContentDisposition": disposition,
+            },
+            ExpiresIn=settings.S3_PRESIGN_EXPIRES,
+        )
+
+    async def exists(self, key: str) -> bool:
+        if self.local_path(key) is not None:
+            return await super().exists(key)
+        return await self._size(key) is not None
+
+    async def read(self, key: str) -> bytes:
+        if self.local_path(key) is not None:
+            return await super().read(key)
+
+        response = await self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        async with response["Body"] as body:
+            return await body.read()
+
+    async def put(self, src_path: str, key: str) -> None:
+        async with async_open(src_path, "rb") as src:
+            body = await src.read()
+        await self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=body)
+
+    async def delete(self, key: str) -> int:
+        if self.local_path(key) is not None:
+            return await super().delete(key)
+
+        size = await self._size(key)
+        if size is None:
+            return 0
+        await self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        return size
+
+    async def _size(self, key: str) -> Optional[int]:
+        try:
+            head = await self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as exc:
+            if getattr(exc, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+
+def create_storage() -> LocalStorage:
+    if settings.MEDIA_STORAGE == "s3":
+        return S3Storage(settings.OUT_FILE_PATH, settings.S3_BUCKET, settings.S3_PREFIX)
+    return LocalStorage(settings.OUT_FILE_PATH)
+
+
+storage = create_storage()
@@ -0,0 +1,134 @@
+import asyncio
+import io
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from aiofiles import open as async_open
+from aiofiles import os as async_os
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.jobs import BackgroundWorker
+from app.storage import storage, variant_key
+
+
+logger = logging.getLogger(__name__)
+
+# (вариант, расширение, содержимое, ширина, высота)
+RenderedVariant = Tuple[str, str, bytes, int, int]
+
+variants_worker = BackgroundWorker("thumbnails", settings.MEDIA_VARIANT_WORKERS, settings.MEDIA_VARIANT_QUEUE_SIZE)
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def render_variants(data: bytes, sizes: Sequence[Tuple[str, int]], jpeg_quality: int) -> List[RenderedVariant]:
+    """
+    Уменьшенные копии изображения для каждого (вариант, наибольшая сторона).
+
+    Выполняется в отдельном процессе. Копии сохраняются без EXIF и прочих метаданных,
+    ориентация из EXIF применяется к пикселям. Изображение меньше варианта не увеличивается,
+    а перекодируется в исходном размере - один раз, для первого такого варианта: так у любого
+    изображения есть хотя бы одна копия без метаданных, и оригинал не попадает в ленту.
+    """
+
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    rendered = []
+    full_size_rendered = False
+    for variant, max_side in sorted(sizes, key=lambda size: size[1]):
+        if max(image.size) <= max_side:
+            if full_size_rendered:
+                continue
+            full_size_rendered = True
+
+        resized = image.copy()
+        resized.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        if has_alpha:
+            resized.save(out, "PNG", optimize=True)
+            extension = "png"
+        else:
+            resized.save(out, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+            extension = "jpeg"
+        rendered.append((variant, extension, out.getvalue(), *resized.size))
+
+    return rendered
+
+
+def is_image(content_type: Optional[str]) -> bool:
+    return (content_type or "").startswith("image/") and content_type != "image/svg+xml"
+
+
+async def start() -> None:
+    global _executor
+    _executor = ProcessPoolExecutor(max_workers=settings.MEDIA_VARIANT_PROCESSES)
+    await variants_worker.start()
+
+
+async def stop() -> None:
+    global _executor
+    await variants_worker.stop()
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def generate_variants(session: AsyncSession, media_id: int) -> None:
+    """
+    Построение уменьшенных копий загруженного изображения и сохранение их как Media
+    с parent_id оригинала. Повторный запуск для того же медиа ничего не дублирует.
+    """
+
+    res = await session.execute(select(models.Media.path, models.Media.sha256).filter_by(id=media_id))
+    original = res.one_or_none()
+    if original is None or original.sha256 is None:
+        return
+
+    data = await storage.read(original.path)
+    sizes = list(settings.MEDIA_VARIANTS.items())
+    loop = asyncio.get_running_loop()
+    try:
+        rendered = await loop.run_in_executor(
+            _executor, render_variants, data, sizes, settings.MEDIA_VARIANT_JPEG_QUALITY
+        )
+    except Exception as exc:
+        logger.info("media %s is not a processable image: %s", media_id, exc)
+        return
+
+    for variant, extension, content, width, height in rendered:
+        key = variant_key(original.sha256, variant, extension)
+        tmp_path = os.path.join(settings.OUT_FILE_PATH, f".{uuid.uuid4().hex}.part")
+        try:
+            async with async_open(tmp_path, "wb") as tmp:
+                await tmp.write(content)
+            await storage.put(tmp_path, key)
+        finally:
+            await async_os.remove(tmp_path)
+
+        await session.execute(
+            insert(models.Media)
+            .values(parent_id=media_id, variant=variant, path=key, size=len(content), width=width, height=height)
+            .on_conflict_do_nothing(index_elements=["parent_id", "variant"])
+        )
+
+    if rendered:
+        # Твиты с этим медиа теперь ссылаются на копию: их ETag в ленте должен измениться
+        await session.execute(
+            update(models.Tweet)
+            .where(models.Tweet.id.in_(select(models.tweet_media.c.tweet_id).filter_by(media_id=media_id)))
+            .values(updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+
@@ -0,0 +1,221 @@
+"""
+Лента твитов по подпискам: в режиме pull строится при чтении, в режиме push читается
+из таблицы timeline, которую заполняет раздача твитов (`fanout`).
+
+Твиты, опубликованные до включения режима push, в ленты не попадали. После переключения
+TIMELINE_MODE=push (когда раздача уже работает) ленты заполняются однократно
+(из корня проекта):
+
+    PYTHONPATH=.:app python -m app.timeline --backfill
+"""
+import argparse
+import asyncio
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Integer, delete, exists, literal, literal_column, select, true, tuple_, union
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import ColumnElement, Select, Subquery
+
+from app import models
+from app.config import settings
+from app.db.session import async_session
+from app.jobs import BackgroundWorker
+
+
+fanout = BackgroundWorker("timeline", settings.TIMELINE_FANOUT_WORKERS, settings.TIMELINE_FANOUT_QUEUE_SIZE)
+
+
+def is_push_mode() -> bool:
+    return settings.TIMELINE_MODE == "push"
+
+
+def is_celebrity(user_id) -> ColumnElement:
+    """
+    Условие "у пользователя больше подписчиков, чем порог раздачи".
+    Такие авторы не раздаются по лентам и подмешиваются при чтении.
+    """
+
+    return exists(
+        select(literal_column("1"))
+        .select_from(models.User)
+        .where(models.User.id == user_id, models.User.follower_count > settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+    )
+
+
+async def fanout_tweet(session: AsyncSession, tweet_id: int) -> None:
+    """
+    Раздача твита по лентам подписчиков автора.
+    """
+
+    tweet, uf = models.Tweet, models.user_following
+    rows = (
+        select(uf.c.user_id, tweet.id, tweet.created_at)
+        .join(uf, uf.c.following_id == tweet.user_id)
+        .where(tweet.id == tweet_id, ~is_celebrity(tweet.user_id))
+    )
+    stmt = insert(models.Timeline).from_select(["user_id", "tweet_id", "created_at"], rows)
+    await session.execute(stmt.on_conflict_do_nothing())
+
+
+async def backfill_follow(session: AsyncSession, user_id: int, following_id: int) -> None:
+    """
+    Заполнение ленты последними твитами пользователя, на которого оформлена подписка.
+    """
+
+    tweet = models.Tweet
+    rows = (
+        select(literal(user_id, Integer), tweet.id, tweet.created_at)
+        .where(tweet.user_id == following_id, ~is_celebrity(following_id))
+        .order_by(tweet.created_at.desc(), tweet.id.desc())
+        .limit(settings.TIMELINE_BACKFILL_LIMIT)
+    )
+    stmt = insert(models.Timeline).from_select(["user_id", "tweet_id", "created_at"], rows)
+    await session.execute(stmt.on_conflict_do_nothing())
+
+
+async def backfill_author(session: AsyncSession, author_id: int) -> None:
+    """
+    Раздача последних твитов автора, опустившегося до порога раздачи, по лентам всех его
+    подписчиков: пока он был выше порога, его твиты подмешивались при чтении и в ленты
+    не попадали, а теперь читаются только из них.
+    """
+
+    tweet, uf = models.Tweet, models.user_following
+    latest = (
+        select(tweet.id, tweet.created_at)
+        .where(tweet.user_id == author_id)
+        .order_by(tweet.created_at.desc(), tweet.id.desc())
+        .limit(settings.TIMELINE_BACKFILL_LIMIT)
+        .subquery()
+    )
+    rows = (
+        select(uf.c.user_id, latest.c.id, latest.c.created_at)
+        .select_from(uf)
+        .join(latest, true())
+        .where(uf.c.following_id == author_id, ~is_celebrity(author_id))
+    )
+    stmt = insert(models.Timeline).from_select(["user_id", "tweet_id", "created_at"], rows)
+    await session.execute(stmt.on_conflict_do_nothing())
+
+
+async def backfill_users(session: AsyncSession, user_ids: List[int]) -> None:
+    """
+    Заполнение лент пользователей последними твитами всех авторов, на которых они подписаны
+    (ниже порога раздачи) - как при оформлении каждой подписки в режиме push.
+    """
+
+    tweet, uf = models.Tweet, models.user_following
+    latest = (
+        select(tweet.id, tweet.created_at)
+        .where(tweet.user_id == uf.c.following_id)
+        .order_by(tweet.created_at.desc(), tweet.id.desc())
+        .limit(settings.TIMELINE_BACKFILL_LIMIT)
+        .lateral()
+    )
+    rows = (
+        select(uf.c.user_id, latest.c.id, latest.c.created_at)
+        .select_from(uf)
+        .join(latest, true())
+        .where(uf.c.user_id.in_(user_ids), ~is_celebrity(uf.c.following_id))
+    )
+    stmt = insert(models.Timeline).from_select(["user_id", "tweet_id", "created_at"], rows)
+    await session.execute(stmt.on_conflict_do_nothing())
+
+
+async def prune_follow(session: AsyncSession, user_id: int, following_id: int) -> None:
+    """
+    Удаление из ленты твитов пользователя, подписка на которого отменена.
+    """
+
+    stmt = delete(models.Timeline).where(
+        models.Timeline.user_id == user_id,
+        models.Timeline.tweet_id == models.Tweet.id,
+        models.Tweet.user_id == following_id,
+    )
+    await session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def feed_window(user_id: int, limit: int, before: Optional[Tuple] = None) -> Subquery:
+    """
+    Подзапрос (id, created_at) твитов одной страницы ленты.
+
+    В режиме pull страница строится по подпискам, в режиме push - диапазонным
+    чтением таблицы timeline с подмешиванием твитов авторов выше порога раздачи.
+    """
+
+    tweet, uf = models.Tweet, models.user_following
+
+    pulled = (
+        select(tweet.id, tweet.created_at)
+        .join(uf, uf.c.following_id == tweet.user_id)
+        .where(uf.c.user_id == user_id)
+    )
+    if before is not None:
+        pulled = pulled.where(tuple_(tweet.created_at, tweet.id) < tuple_(*before))
+
+    if not is_push_mode():
+        return pulled.order_by(tweet.created_at.desc(), tweet.id.desc()).limit(limit).subquery()
+
+    pushed = select(models.Timeline.tweet_id.label("id"), models.Timeline.created_at).where(
+        models.Timeline.user_id == user_id
+    )
+    if before is not None:
+        pushed = pushed.where(tuple_(models.Timeline.created_at, models.Timeline.tweet_id) < tuple_(*before))
+
+    pushed = pushed.order_by(models.Timeline.created_at.desc(), models.Timeline.tweet_id.desc()).limit(limit)
+    pulled = (
+        pulled.where(is_celebrity(uf.c.following_id))
+        .order_by(tweet.created_at.desc(), tweet.id.desc())
+        .limit(limit)
+    )
+
+    merged = union(pushed, pulled).subquery()
+    return (
+        select(merged.c.id, merged.c.created_at)
+        .order_by(merged.c.created_at.desc(), merged.c.id.desc())
+        .limit(limit)
+        .subquery()
+    )
+
+
+def window_versions(window: Subquery) -> Select:
+    """
+    Пары (id, updated_at) твитов страницы ленты - маркеры её версии для ETag,
+    без загрузки связей твитов.
+    """
+
+    return select(models.Tweet.id, models.Tweet.updated_at).join(window, window.c.id == models.Tweet.id)
+
+
+async def backfill_all(batch_size: int) -> int:
+    """
+    Заполнение лент всех пользователей пачками по keyset (id); возвращает число пользователей.
+    """
+
+    done, after_id = 0, 0
+    while True:
+        async with async_session() as session:
+            user_ids = (
+                await session.scalars(
+                    select(models.User.id).where(models.User.id > after_id).order_by(models.User.id).limit(batch_size)
+                )
+            ).all()
+            if not user_ids:
+                return done
+            await backfill_users(session, user_ids)
+            await session.commit()
+        done += len(user_ids)
+        after_id = user_ids[-1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="заполнить ленты всех пользователей")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("nothing to do, pass --backfill")
+
+    count = asyncio.run(backfill_all(args.batch_size))
+    print(f"backfilled timelines of {count} users")
@@ -1,9 +1,86 @@
+import base64
+import binascii
+import hashlib
+import os
 import uuid
+from datetime import datetime
+from typing import Tuple
 
+from aiofiles import open as async_open
+from aiofiles import os as async_os
+from fastapi import UploadFile
 
-def get_rnd_file_name_by_content_type(content_type: str) -> str:
+
+class MediaTooLarge(Exception):
+    pass
+
+
+def encode_feed_cursor(created_at: datetime, tweet_id: int) -> str:
+    """
+    Формирование непрозрачного курсора ленты по последнему твиту страницы.
+    """
+
+    raw = f"{created_at.isoformat()}|{tweet_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_feed_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Разбор курсора ленты. При некорректном значении выбрасывается ValueError.
+    """
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, tweet_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(tweet_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+def encode_search_cursor(rank: float, tweet_id: int) -> str:
     """
-    Генерация случайного имени файла.
+    Формирование непрозрачного курсора поиска по рангу и id последнего твита страницы.
     """
 
-    return '.'.join([uuid.uuid4().hex, content_type.split("/")[-1]])
+    raw = f"{rank!r}|{tweet_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    Разбор курсора поиска. При некорректном значении выбрасывается ValueError.
+    """
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, tweet_id = raw.rsplit("|", 1)
+        return float(rank), int(tweet_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+async def stream_upload(file: UploadFile, directory: str, max_size: int, chunk_size: int) -> Tuple[str, int, str]:
+    """
+    Потоковая запись загружаемого файла во временный файл по частям фиксированного размера.
+
+    Возвращает путь к временному файлу, размер и SHA-256 содержимого.
+    При превышении max_size временный файл удаляется и выбрасывается MediaTooLarge.
+    """
+
+    tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with async_open(tmp_path, "wb") as out_file:
+            while chunk := await file.read(chunk_size):
+                size += len(chunk)
+                if size > max_size:
+                    raise MediaTooLarge(f"file exceeds {max_size} bytes")
+                digest.update(chunk)
+                await out_file.write(chunk)
+    except BaseException:
+        await async_os.remove(tmp_path)
+        raise
+
+    return tmp_path, size, digest.hexdigest()
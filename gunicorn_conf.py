@@ -0,0 +1,71 @@
+"""
+Конфигурация gunicorn для продакшена: несколько воркеров uvicorn (uvloop и httptools
+подключаются автоматически, если установлены - extra uvicorn[standard]).
+
+    gunicorn -c gunicorn_conf.py app.main:app
+
+Параметры берутся из настроек приложения (SERVER_*, см. app/config.py).
+"""
+import multiprocessing
+import os
+import shutil
+
+import yaml
+
+# Метрики воркеров собираются через общий каталог prometheus_client. Переменные должны быть
+# заданы до импорта prometheus_client, то есть до загрузки приложения
+multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+# Имя в нижнем регистре проверяет prometheus-fastapi-instrumentator при выдаче /metrics
+os.environ.setdefault("prometheus_multiproc_dir", multiproc_dir)
+# С preload_app приложение импортируется раньше on_starting, каталог нужен уже сейчас
+os.makedirs(multiproc_dir, exist_ok=True)
+
+from gunicorn.glogging import CONFIG_DEFAULTS  # noqa: E402
+from prometheus_client import multiprocess  # noqa: E402
+
+from app.config import settings  # noqa: E402
+
+
+bind = f"{settings.SERVER_HOST}:{settings.SERVER_PORT}"
+workers = settings.SERVER_WORKERS or multiprocessing.cpu_count()
+# Запись сбрасывает локальный кэш ответов только в своём воркере, остальные отдавали бы
+# устаревшие ответы до истечения TTL: при нескольких воркерах кэш нужен общий (redis)
+local_response_cache_disabled = workers > 1 and settings.RESPONSE_CACHE_BACKEND == "local"
+if local_response_cache_disabled:
+    settings.RESPONSE_CACHE_BACKEND = "none"
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = settings.SERVER_PRELOAD
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+timeout = settings.SERVER_TIMEOUT
+keepalive = settings.SERVER_KEEPALIVE
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+
+# Логирование uvicorn и приложения - как в app/log_conf.yml, поверх настроек gunicorn по умолчанию
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "log_conf.yml")) as f:
+    app_logging = yaml.safe_load(f)
+logconfig_dict = {
+    **CONFIG_DEFAULTS,
+    **{key: {**CONFIG_DEFAULTS.get(key, {}), **app_logging[key]} for key in ("formatters", "handlers", "loggers")},
+}
+# Иначе сообщения gunicorn выводятся дважды: своим обработчиком и корневым
+for name in ("gunicorn.error", "gunicorn.access"):
+    logconfig_dict["loggers"][name] = {**logconfig_dict["loggers"][name], "propagate": False}
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска дали бы устаревшие значения счётчиков. Вызывается
+    # один раз при запуске мастера, до fork воркеров (но не при перезагрузке по SIGHUP)
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+    if local_response_cache_disabled:
+        server.log.warning(
+            "RESPONSE_CACHE_BACKEND=local is not shared between %s workers, response cache disabled; "
+            "set RESPONSE_CACHE_BACKEND=redis",
+            workers,
+        )
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
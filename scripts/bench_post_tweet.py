@@ -0,0 +1,64 @@
+"""
+Бенчмарк числа обращений к БД при создании твита в зависимости от количества вложений.
+
+Запуск из корня проекта (нужна настроенная БД из .env):
+
+    PYTHONPATH=.:app python -m scripts.bench_post_tweet --attachments 0 1 2 5 10 20
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import models
+from app.db.session import async_session
+from app.main import app
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def create_fixtures(max_attachments: int):
+    async with async_session() as session:
+        user = models.User(username=f"bench-{uuid.uuid4().hex[:8]}", key=uuid.uuid4().hex)
+        media = [models.Media(path="/dev/null") for _ in range(max_attachments)]
+        session.add(user)
+        session.add_all(media)
+        await session.commit()
+        return user.key, [m.id for m in media]
+
+
+async def main(attachments, repeat: int):
+    api_key, media_ids = await create_fixtures(max(attachments))
+    counter = StatementCounter()
+    event.listen(Engine, "before_cursor_execute", counter)
+
+    print(f"{'attachments':>12} {'statements':>11} {'ms/request':>11}")
+    async with httpx.AsyncClient(app=app, base_url="http://bench", headers={"api-key": api_key}) as client:
+        for n in attachments:
+            counter.count = 0
+            started = time.perf_counter()
+            for _ in range(repeat):
+                response = await client.post("/api/tweets", json={"tweet_data": "bench", "tweet_media_ids": media_ids[:n]})
+                response.raise_for_status()
+            elapsed = (time.perf_counter() - started) / repeat
+            print(f"{n:>12} {counter.count / repeat:>11.1f} {elapsed * 1000:>11.2f}")
+
+    event.remove(Engine, "before_cursor_execute", counter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attachments", type=int, nargs="+", default=[0, 1, 2, 5, 10, 20])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.attachments, args.repeat))
@@ -0,0 +1,351 @@
+"""
+Нагрузочный тест всех endpoint'ов app/routes.py через ASGI-клиент.
+
+Каждый сценарий выполняется заданное число раз с заданной параллельностью; для него
+считаются p50/p95/p99 задержки, пропускная способность, среднее число запросов к БД
+(из заголовка Server-Timing, см. app/profiling.py) и распределение кодов ответа.
+Результаты пишутся в JSON вместе с коммитом и настройками, чтобы сравнивать прогоны:
+
+    PYTHONPATH=.:app python -m scripts.generate_social_graph --users 10000 --seed 1
+    PYTHONPATH=.:app python -m scripts.bench_routes --concurrency 16 --requests 500 --output before.json
+    ...
+    PYTHONPATH=.:app python -m scripts.bench_routes --concurrency 16 --requests 500 --compare before.json
+
+Клиенты выбираются среди пользователей генератора (ключи gen-key-<id>).
+
+Ограничение частоты и числа одновременных запросов (app/limits.py) на время прогона
+отключается: иначе сценарии измеряли бы 429 и ожидание в очереди, а не обработчики.
+С --limits они остаются включены, как настроены.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+import httpx
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app import limits
+from app import models
+from app.cache import NullCacheBackend, response_cache
+from app.config import settings
+from app.db.session import async_session
+from app.main import app
+
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+class Fixtures:
+    def __init__(
+            self, users: list, tweet_ids: List[int], media_ids: List[int], search_words: List[str], rng: random.Random
+    ):
+        self.users = users
+        self.tweet_ids = tweet_ids
+        self.media_ids = media_ids
+        self.search_words = search_words
+        self.rng = rng
+        self.created_tweets: list = []
+        self.likes: list = []
+        self.follows: list = []
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def other_user(self, user):
+        while True:
+            other = self.user()
+            if other.id != user.id:
+                return other
+
+
+async def load_fixtures(sample: int, rng: random.Random) -> Fixtures:
+    async with async_session() as session:
+        users = (
+            await session.execute(
+                select(models.User.id, models.User.key)
+                .where(models.User.key.like("gen-key-%"))
+                .order_by(func.random())
+                .limit(sample)
+            )
+        ).all()
+        tweets = (
+            await session.execute(select(models.Tweet.id, models.Tweet.post).order_by(func.random()).limit(sample))
+        ).all()
+        tweet_ids = [tweet.id for tweet in tweets]
+        # Слова из случайных твитов: частые слова встречаются в запросах чаще, как в текстах
+        search_words = [word for tweet in tweets for word in (tweet.post or "").split() if word.isalnum()]
+        media_ids = (
+            await session.execute(select(models.Media.id).order_by(func.random()).limit(sample))
+        ).scalars().all()
+
+    if not users or not tweet_ids:
+        raise SystemExit("no synthetic data: run scripts.generate_social_graph first")
+    return Fixtures(users, tweet_ids, media_ids, search_words, rng)
+
+
+class Scenario:
+    """
+    Сценарий: build(fixtures) возвращает (api_key, kwargs для httpx) или None, если
+    запрос сделать не из чего; after(request, response) запоминает созданные сущности.
+    """
+
+    def __init__(self, name: str, build: Callable, after: Optional[Callable] = None):
+        self.name = name
+        self.build = build
+        self.after = after
+
+
+def _get(path: str):
+    return lambda f: (f.user().key, {"method": "GET", "url": path})
+
+
+def _post_tweet(f: Fixtures):
+    user = f.user()
+    media_ids = f.rng.sample(f.media_ids, min(len(f.media_ids), f.rng.choice((0, 0, 1, 2))))
+    return user.key, {"method": "POST", "url": "/api/tweets", "json": {"tweet_data": "bench", "tweet_media_ids": media_ids}}
+
+
+def _post_media(f: Fixtures):
+    content = os.urandom(4096)
+    return f.user().key, {"method": "POST", "url": "/api/medias", "files": {"file": ("bench.png", content, "image/png")}}
+
+
+def _delete_tweet(f: Fixtures):
+    if not f.created_tweets:
+        return None
+    key, tweet_id = f.created_tweets.pop()
+    return key, {"method": "DELETE", "url": f"/api/tweets/{tweet_id}"}
+
+
+def _post_like(f: Fixtures):
+    user = f.user()
+    return user.key, {"method": "POST", "url": f"/api/tweets/{f.rng.choice(f.tweet_ids)}/likes"}
+
+
+def _delete_like(f: Fixtures):
+    if not f.likes:
+        return None
+    key, url = f.likes.pop()
+    return key, {"method": "DELETE", "url": url}
+
+
+def _post_follow(f: Fixtures):
+    user = f.user()
+    return user.key, {"method": "POST", "url": f"/api/users/{f.other_user(user).id}/follow"}
+
+
+def _delete_follow(f: Fixtures):
+    if not f.follows:
+        return None
+    key, url = f.follows.pop()
+    return key, {"method": "DELETE", "url": url}
+
+
+def _search(words: int = 1, by_author: bool = False):
+    def build(f: Fixtures):
+        if not f.search_words:
+            return None
+        params = {"q": " ".join(f.rng.choice(f.search_words) for _ in range(words))}
+        if by_author:
+            params["author_id"] = f.user().id
+        return f.user().key, {"method": "GET", "url": "/api/tweets/search", "params": params}
+    return build
+
+
+def _batch(path: str, pick: Callable, size: int = 20):
+    return lambda f: (f.user().key, {"method": "POST", "url": path, "json": {"ids": [pick(f) for _ in range(size)]}})
+
+
+def _remember(target: str, extract=lambda request, response: request[1]["url"]):
+    def after(f: Fixtures, request, response: httpx.Response):
+        if response.status_code == 201:
+            getattr(f, target).append((request[0], extract(request, response)))
+    return after
+
+
+SCENARIOS = [
+    Scenario("GET /api/tweets", _get("/api/tweets")),
+    Scenario("GET /api/tweets?counts=true", _get("/api/tweets?counts=true")),
+    Scenario("GET /api/tweets/search 1 word", _search()),
+    Scenario("GET /api/tweets/search 2 words", _search(words=2)),
+    Scenario("GET /api/tweets/search author", _search(by_author=True)),
+    Scenario("GET /api/users/me", _get("/api/users/me")),
+    Scenario("GET /api/users/{id}", lambda f: (f.user().key, {"method": "GET", "url": f"/api/users/{f.user().id}"})),
+    Scenario(
+        "GET /api/users/{id}?counts=true",
+        lambda f: (f.user().key, {"method": "GET", "url": f"/api/users/{f.user().id}?counts=true"}),
+    ),
+    Scenario(
+        "GET /api/users?ids=",
+        lambda f: (f.user().key, {"method": "GET", "url": "/api/users?ids=" + ",".join(str(f.user().id) for _ in range(20))}),
+    ),
+    Scenario(
+        "GET /api/users/{id}/followers",
+        lambda f: (f.user().key, {"method": "GET", "url": f"/api/users/{f.user().id}/followers"}),
+    ),
+    Scenario(
+        "GET /api/users/{id}/following",
+        lambda f: (f.user().key, {"method": "GET", "url": f"/api/users/{f.user().id}/following"}),
+    ),
+    Scenario(
+        "GET /api/tweets/{id}/likes",
+        lambda f: (f.user().key, {"method": "GET", "url": f"/api/tweets/{f.rng.choice(f.tweet_ids)}/likes"}),
+    ),
+    Scenario(
+        "GET /api/medias/{id}",
+        lambda f: (f.user().key, {"method": "GET", "url": f"/api/medias/{f.rng.choice(f.media_ids)}"})
+        if f.media_ids else None,
+    ),
+    Scenario("POST /api/medias", _post_media),
+    Scenario(
+        "POST /api/tweets", _post_tweet,
+        _remember("created_tweets", lambda request, response: response.json()["tweet_id"]),
+    ),
+    Scenario("DELETE /api/tweets/{id}", _delete_tweet),
+    Scenario("POST /api/tweets/{id}/likes", _post_like, _remember("likes")),
+    Scenario("DELETE /api/tweets/{id}/likes", _delete_like),
+    Scenario("POST /api/users/{id}/follow", _post_follow, _remember("follows")),
+    Scenario("DELETE /api/users/{id}/follow", _delete_follow),
+    Scenario("POST /api/tweets/likes/batch", _batch("/api/tweets/likes/batch", lambda f: f.rng.choice(f.tweet_ids))),
+    Scenario("POST /api/users/follow/batch", _batch("/api/users/follow/batch", lambda f: f.user().id)),
+]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+async def run_scenario(client: httpx.AsyncClient, fixtures: Fixtures, scenario: Scenario, requests: int, concurrency: int):
+    remaining = iter(range(requests))
+    latencies, queries, statuses = [], [], Counter()
+
+    async def worker():
+        for _ in remaining:
+            request = scenario.build(fixtures)
+            if request is None:
+                return
+            api_key, kwargs = request
+
+            started = time.perf_counter()
+            response = await client.request(headers={"api-key": api_key}, **kwargs)
+            latencies.append(time.perf_counter() - started)
+
+            statuses[response.status_code] += 1
+            match = QUERIES_RE.search(response.headers.get("server-timing", ""))
+            if match:
+                queries.append(int(match.group(1)))
+            if scenario.after is not None:
+                scenario.after(fixtures, request, response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "queries_mean": sum(queries) / len(queries) if queries else None,
+        "queries_max": max(queries) if queries else None,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: dict, baseline: Optional[dict]) -> None:
+    header = f"{'route':<34} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8}  statuses"
+    print(header)
+    print("-" * len(header))
+    for name, row in results["routes"].items():
+        queries = f"{row['queries_mean']:.1f}" if row["queries_mean"] is not None else "-"
+        line = (
+            f"{name:<34} {row['throughput_rps']:>8.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+            f"{row['p99_ms']:>8.2f} {queries:>8}  {row['statuses']}"
+        )
+        old = (baseline or {}).get("routes", {}).get(name)
+        if old and old["p95_ms"]:
+            line += f"  p95 {(row['p95_ms'] / old['p95_ms'] - 1) * 100:+.0f}% vs {baseline.get('commit')}"
+        print(line)
+
+
+async def main(args):
+    settings.SERVER_TIMING = True
+    if args.no_cache:
+        response_cache.backend = NullCacheBackend()
+    if not args.limits:
+        limits.rate_limiter.backend = limits.NullRateLimitBackend()
+        # Параллельность прогона не выше --concurrency: очередь допуска не используется
+        limits.admission.max_concurrency = max(limits.admission.max_concurrency, args.concurrency)
+
+    selected = [s for s in SCENARIOS if not args.routes or any(r in s.name for r in args.routes)]
+    fixtures = await load_fixtures(args.sample, random.Random(args.seed))
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            routes = {}
+            for scenario in selected:
+                routes[scenario.name] = await run_scenario(client, fixtures, scenario, args.requests, args.concurrency)
+    finally:
+        await app.router.shutdown()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "sample": args.sample,
+            "seed": args.seed,
+            "response_cache": "none" if args.no_cache else settings.RESPONSE_CACHE_BACKEND,
+            "limits": args.limits,
+            "timeline_mode": settings.TIMELINE_MODE,
+        },
+        "routes": routes,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="запросов на сценарий")
+    parser.add_argument("--routes", nargs="*", help="подстроки имён сценариев, например 'GET /api/tweets'")
+    parser.add_argument("--sample", type=int, default=500, help="сколько пользователей, твитов и медиа выбрать")
+    parser.add_argument("--no-cache", action="store_true", help="отключить кэш ответов на время прогона")
+    parser.add_argument("--limits", action="store_true", help="не отключать ограничение частоты и допуск запросов")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения p95")
+    asyncio.run(main(parser.parse_args()))
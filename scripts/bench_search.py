@@ -0,0 +1,97 @@
+"""
+Сравнение полнотекстового поиска по GIN-индексу (app/search.py) со сканированием ILIKE.
+
+Для терминов разной частоты (из словаря генератора: word1 - самое частое слово,
+word<N> - всё более редкие) замеряется медианное время страницы поиска обоими способами
+и число просмотренных строк из EXPLAIN ANALYZE. ILIKE читает таблицу до набора страницы,
+то есть для редких терминов - целиком, и его время растёт с размером таблицы; поиск по
+индексу читает только совпадения, и его время определяется их числом.
+
+    PYTHONPATH=.:app python -m scripts.generate_social_graph --users 20000 --mean-tweets 25 --seed 1
+    PYTHONPATH=.:app python -m scripts.bench_search --terms word1 word100 word5000 word19000
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import time
+from typing import List
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+
+from app import models
+from app import search
+from app.db.session import async_session
+
+
+ROWS_RE = re.compile(r"\(actual time=[\d.]+\.\.[\d.]+ rows=(\d+) loops=(\d+)\)")
+
+
+def fts_page(term: str, limit: int):
+    window = search.search_window(term, limit)
+    return select(window.c.id).order_by(window.c.rank.desc(), window.c.id.desc())
+
+
+def ilike_page(term: str, limit: int):
+    tweet = models.Tweet
+    return select(tweet.id).where(tweet.post.ilike(f"%{term}%")).order_by(tweet.id.desc()).limit(limit)
+
+
+async def timed(session, stmt, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        (await session.execute(stmt)).all()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+async def rows_examined(session, stmt) -> int:
+    """
+    Сколько строк прочитали узлы сканирования таблицы tweet (по EXPLAIN ANALYZE).
+    """
+
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    plan = (await session.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"))).scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+
+    def walk(node) -> int:
+        examined = 0
+        if node.get("Relation Name") == "tweet":
+            examined += (node["Actual Rows"] + node.get("Rows Removed by Filter", 0)
+                         + node.get("Rows Removed by Index Recheck", 0)) * node["Actual Loops"]
+        return examined + sum(walk(child) for child in node.get("Plans", []))
+
+    return walk(plan[0]["Plan"])
+
+
+async def main(terms: List[str], limit: int, repeat: int):
+    async with async_session() as session:
+        total = await session.scalar(select(func.count()).select_from(models.Tweet))
+        print(f"tweets: {total}, page size: {limit}, median of {repeat} runs\n")
+
+        header = f"{'term':<12} {'matches':>9} {'fts ms':>9} {'fts rows':>9} {'ilike ms':>9} {'ilike rows':>11} {'speedup':>8}"
+        print(header)
+        print("-" * len(header))
+        for term in terms:
+            matches = await session.scalar(
+                select(func.count()).where(models.Tweet.search_vector.op("@@")(search.tweet_query(term)))
+            )
+            fts, ilike = fts_page(term, limit), ilike_page(term, limit)
+            fts_ms, ilike_ms = await timed(session, fts, repeat), await timed(session, ilike, repeat)
+            fts_rows, ilike_rows = await rows_examined(session, fts), await rows_examined(session, ilike)
+            print(
+                f"{term:<12} {matches:>9} {fts_ms:>9.2f} {fts_rows:>9} {ilike_ms:>9.2f} {ilike_rows:>11} "
+                f"{ilike_ms / fts_ms:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", nargs="+", default=["word1", "word10", "word100", "word1000", "word5000", "word19000"])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.terms, args.limit, args.repeat))
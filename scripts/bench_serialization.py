@@ -0,0 +1,58 @@
+"""
+Микро-бенчмарк сериализации ленты: прежний путь (pydantic from_orm -> json -> json.loads,
+повторная валидация FeedSchemaOut, json.dumps) против быстрого (tweet_to_dict + orjson).
+
+БД не требуется, твиты собираются из несохранённых ORM-объектов:
+
+    PYTHONPATH=.:app python -m scripts.bench_serialization --tweets 100 --likes 20 --attachments 2
+"""
+import argparse
+import json
+import timeit
+
+from app import models, schemas
+from app.responses import DefaultResponse
+
+
+def build_feed(tweets: int, likes: int, attachments: int):
+    users = [models.User(id=i, username=f"user{i}", key=str(i)) for i in range(max(likes, 1) + 1)]
+    feed = []
+    for tweet_id in range(tweets):
+        tweet = models.Tweet(id=tweet_id, post="lorem ipsum " * 10, user=users[0], like_count=likes)
+        tweet.media = [models.Media(id=tweet_id * 10 + n, path="/srv/x.png") for n in range(attachments)]
+        tweet.favorites = [models.Favorite(user=users[n + 1]) for n in range(likes)]
+        feed.append(tweet)
+    return feed
+
+
+def render_before(feed) -> bytes:
+    content = {
+        "result": True,
+        "tweets": [json.loads(schemas.TweetSchemaIn.from_orm(tweet).json(models_as_dict=False)) for tweet in feed],
+    }
+    validated = schemas.FeedSchemaOut.parse_obj(content).dict(by_alias=True)
+    return json.dumps(validated).encode("utf-8")
+
+
+def render_after(feed) -> bytes:
+    content = {"result": True, "tweets": [schemas.tweet_to_dict(tweet) for tweet in feed], "next_cursor": None}
+    return DefaultResponse(content).body
+
+
+def main(tweets: int, likes: int, attachments: int, number: int):
+    feed = build_feed(tweets, likes, attachments)
+    assert json.loads(render_before(feed))["tweets"] == json.loads(render_after(feed))["tweets"]
+
+    for name, render in (("before", render_before), ("after", render_after)):
+        best = min(timeit.repeat(lambda: render(feed), number=number, repeat=5)) / number
+        print(f"{name:>7}: {best * 1000:8.3f} ms/page  {best / tweets * 1e6:8.2f} us/tweet")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tweets", type=int, default=100)
+    parser.add_argument("--likes", type=int, default=20)
+    parser.add_argument("--attachments", type=int, default=2)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+    main(args.tweets, args.likes, args.attachments, args.number)
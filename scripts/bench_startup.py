@@ -0,0 +1,131 @@
+"""
+Замер времени до первого запроса (time-to-first-request) производственного сервера
+в разных конфигурациях запуска: с preload_app и без, с предварительным открытием
+соединений пула (DB_POOL_PREFILL) и без.
+
+Для каждой конфигурации запускается gunicorn -c gunicorn_conf.py, адрес опрашивается
+до первого успешного ответа, затем отправляются ещё --requests запросов. Печатаются
+время от запуска до первого ответа, задержка первого ответа и медиана последующих,
+а также метрики воркеров app_startup_seconds и app_time_to_first_request_seconds
+(максимум по воркерам).
+
+Запуск из корня проекта (нужны БД и хотя бы один пользователь):
+
+    PYTHONPATH=.:app python -m scripts.bench_startup --workers 4
+    PYTHONPATH=.:app python -m scripts.bench_startup --path /api/tweets --runs 3
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy.future import select
+
+from app import models
+from app.db.session import async_session
+
+
+CONFIGURATIONS = [
+    ("no preload, no prefill", {"SERVER_PRELOAD": "false", "DB_POOL_PREFILL": "0"}),
+    ("preload, no prefill", {"SERVER_PRELOAD": "true", "DB_POOL_PREFILL": "0"}),
+    ("no preload, prefill", {"SERVER_PRELOAD": "false"}),
+    ("preload, prefill", {"SERVER_PRELOAD": "true"}),
+]
+METRIC_RE = re.compile(r"^(app_startup_seconds|app_time_to_first_request_seconds) ([\d.e+-]+)$", re.MULTILINE)
+
+
+async def first_user_key() -> str:
+    async with async_session() as session:
+        key = await session.scalar(select(models.User.key).order_by(models.User.id).limit(1))
+    if key is None:
+        sys.exit("no users in the database, run scripts.generate_social_graph first")
+    return key
+
+
+async def run_once(env: Dict[str, str], port: int, path: str, api_key: str, requests: int) -> Optional[dict]:
+    env = {**os.environ, **env, "SERVER_HOST": "127.0.0.1", "SERVER_PORT": str(port)}
+    env["PROMETHEUS_MULTIPROC_DIR"] = env["prometheus_multiproc_dir"] = tempfile.mkdtemp(prefix="bench_startup_")
+
+    url = f"http://127.0.0.1:{port}{path}"
+    spawned = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn_conf.py", "app.main:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(headers={"api-key": api_key}, timeout=30) as client:
+            while True:
+                if server.poll() is not None:
+                    return None
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                except httpx.TransportError:
+                    await asyncio.sleep(0.01)
+                    continue
+                first_latency = time.perf_counter() - started
+                response.raise_for_status()
+                break
+            until_first = time.perf_counter() - spawned
+
+            latencies: List[float] = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                (await client.get(url)).raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+            exposition = (await client.get(f"http://127.0.0.1:{port}/metrics")).text
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+    result = {"until_first": until_first, "first": first_latency, "rest": statistics.median(latencies)}
+    result.update({name: float(value) for name, value in METRIC_RE.findall(exposition)})
+    return result
+
+
+async def main(workers: int, port: int, path: str, requests: int, runs: int):
+    api_key = await first_user_key()
+    print(f"GET {path}, {workers} workers, median of {runs} runs, {requests} requests after the first\n")
+
+    header = (
+        f"{'configuration':<24} {'spawn->1st ms':>13} {'1st req ms':>10} {'next req ms':>11} "
+        f"{'startup ms':>10} {'worker ttfr ms':>14}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, env in CONFIGURATIONS:
+        env = {**env, "SERVER_WORKERS": str(workers)}
+        results = [await run_once(env, port, path, api_key, requests) for _ in range(runs)]
+        if None in results:
+            print(f"{name:<24} server exited before answering, check gunicorn -c gunicorn_conf.py manually")
+            continue
+
+        def median(key: str) -> float:
+            return statistics.median(result.get(key, float("nan")) for result in results) * 1000
+
+        print(
+            f"{name:<24} {median('until_first'):>13.1f} {median('first'):>10.1f} {median('rest'):>11.2f} "
+            f"{median('app_startup_seconds'):>10.1f} {median('app_time_to_first_request_seconds'):>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/api/users/me")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.workers, args.port, args.path, args.requests, args.runs))
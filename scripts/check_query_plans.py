@@ -0,0 +1,152 @@
+"""
+Проверка планов горячих запросов: каждый должен читать таблицы по индексу.
+
+Запросы строятся так же, как в app/depends.py, app/routes.py, app/search.py и app/timeline.py, и
+выполняются через EXPLAIN с отключённым последовательным сканированием. Регрессией
+считается Seq Scan, а также полный проход индекса без условия (Index Scan без
+Index Cond): так Postgres обходит отсутствие подходящего индекса при enable_seqscan=off.
+Код возврата 1, если хотя бы один план содержит такое чтение.
+
+На почти пустых таблицах планировщик выбирает индексы произвольно, поэтому перед
+проверкой в транзакции создаются синтетические данные и собирается статистика;
+транзакция затем откатывается, рабочие данные не меняются.
+
+Запуск из корня проекта (нужна настроенная БД из .env с применёнными миграциями):
+
+    PYTHONPATH=.:app python -m scripts.check_query_plans
+"""
+import asyncio
+import json
+import sys
+import warnings
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import Integer, literal, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.future import select
+
+from app import models, search, timeline
+from app.config import settings
+from app.db.session import async_session
+
+
+# Синтетические строки получают id за пределами рабочих последовательностей
+USER_ID = 1_000_000
+TWEET_ID = 1_000_000
+USERS = 1000
+TWEETS = 10000
+FOLLOWING_PER_USER = 10
+LIKES_PER_TWEET = 5
+
+SEED = [
+    f"""INSERT INTO "user" (id, username, key)
+        SELECT g, 'plan-' || g, 'plan-key-' || g FROM generate_series({USER_ID}, {USER_ID + USERS - 1}) g""",
+    f"""INSERT INTO user_following (user_id, following_id)
+        SELECT u, {USER_ID} + (u - {USER_ID} + k * 13) % {USERS}
+        FROM generate_series({USER_ID}, {USER_ID + USERS - 1}) u, generate_series(1, {FOLLOWING_PER_USER}) k""",
+    f"""INSERT INTO tweet (id, user_id, post, created_at)
+        SELECT g, {USER_ID} + g % {USERS}, 'plan word' || g % 1000, now() - (g - {TWEET_ID}) * interval '1 second'
+        FROM generate_series({TWEET_ID}, {TWEET_ID + TWEETS - 1}) g""",
+    f"""INSERT INTO favorite (user_id, tweet_id)
+        SELECT {USER_ID} + (t * k * 31) % {USERS}, t
+        FROM generate_series({TWEET_ID}, {TWEET_ID + TWEETS - 1}) t, generate_series(1, {LIKES_PER_TWEET}) k
+        ON CONFLICT DO NOTHING""",
+    f"""INSERT INTO media (id, path, sha256)
+        SELECT g, '/dev/null', md5(g::text) || md5(g::text) FROM generate_series({TWEET_ID}, {TWEET_ID + TWEETS - 1}) g""",
+    f"""INSERT INTO tweet_media (tweet_id, media_id)
+        SELECT g, g FROM generate_series({TWEET_ID}, {TWEET_ID + TWEETS - 1}) g""",
+    f"""INSERT INTO timeline (user_id, tweet_id, created_at)
+        SELECT uf.user_id, t.id, t.created_at
+        FROM user_following uf JOIN tweet t ON t.user_id = uf.following_id
+        WHERE uf.user_id >= {USER_ID}""",
+    'ANALYZE "user", user_following, tweet, favorite, media, tweet_media, timeline',
+]
+
+
+def feed_query(mode: str):
+    settings.TIMELINE_MODE = mode
+    window = timeline.feed_window(USER_ID, settings.FEED_PAGE_SIZE, (literal("2100-01-01"), TWEET_ID))
+    return (
+        select(models.Tweet)
+        .join(window, window.c.id == models.Tweet.id)
+        .order_by(window.c.created_at.desc(), window.c.id.desc())
+    )
+
+
+def hot_queries() -> List[Tuple[str, object]]:
+    uf = models.user_following
+    return [
+        ("auth by api-key", select(models.User.id, models.User.username).filter_by(key="test")),
+        ("profile by id", select(models.User).filter_by(id=USER_ID)),
+        (
+            "profile followers",
+            select(models.User.id).join(uf, uf.c.user_id == models.User.id).where(uf.c.following_id == USER_ID),
+        ),
+        (
+            "profile following",
+            select(models.User.id).join(uf, uf.c.following_id == models.User.id).where(uf.c.user_id == USER_ID),
+        ),
+        ("tweet by id", select(models.Tweet).filter_by(id=TWEET_ID)),
+        ("tweet likes", select(models.Favorite.user_id).where(models.Favorite.tweet_id.in_([TWEET_ID, TWEET_ID + 1]))),
+        (
+            "tweet media",
+            select(models.tweet_media.c.media_id).where(models.tweet_media.c.tweet_id.in_([TWEET_ID, TWEET_ID + 1])),
+        ),
+        (
+            "media references",
+            select(models.tweet_media.c.tweet_id).where(models.tweet_media.c.media_id == literal(TWEET_ID, Integer)),
+        ),
+        ("media by hash", select(models.Media.id).filter_by(sha256="0" * 64)),
+        ("user tweets", select(models.Tweet.id).where(models.Tweet.user_id == USER_ID)),
+        ("feed (pull)", feed_query("pull")),
+        ("feed (push)", feed_query("push")),
+        ("tweet search", select(search.search_window("word42", settings.FEED_PAGE_SIZE))),
+        (
+            "timeline by tweet",
+            select(models.Timeline.user_id).where(models.Timeline.tweet_id == literal(TWEET_ID, Integer)),
+        ),
+    ]
+
+
+def plan_nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def is_full_scan(node: dict) -> bool:
+    if node["Node Type"] == "Seq Scan":
+        return True
+    return node["Node Type"] in ("Index Scan", "Index Only Scan") and "Index Cond" not in node
+
+
+async def main() -> int:
+    warnings.filterwarnings("ignore", category=SAWarning)
+    failed = 0
+    async with async_session() as session:
+        for statement in SEED:
+            await session.execute(text(statement))
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, stmt in hot_queries():
+            sql = stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+            res = await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+            plan = res.scalar_one()
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+            full_scans = [
+                f"{node['Node Type']} on {node['Relation Name']}" for node in plan_nodes(plan) if is_full_scan(node)
+            ]
+            if full_scans:
+                failed += 1
+                print(f"FAIL {name}: {'; '.join(full_scans)}")
+            else:
+                print(f"ok   {name}")
+
+        await session.rollback()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
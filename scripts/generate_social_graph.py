@@ -0,0 +1,187 @@
+"""
+Генератор синтетического социального графа с распределениями, близкими к продовым.
+
+Популярность авторов подчиняется закону Ципфа: число подписчиков пользователя ранга r
+пропорционально 1 / r^s, поэтому немногие "знаменитости" собирают большую часть подписок.
+Число лайков твита распределено по Парето с поправкой на популярность автора -
+отдельные твиты становятся "вирусными". Слова в текстах твитов тоже выбираются по Ципфу
+из словаря псевдослов word<ранг> (word1 - самое частое), чтобы поиск (scripts/bench_search.py)
+встречал и частые, и редкие термины. Все строки загружаются через COPY
+(asyncpg copy_records_to_table), счётчики like_count / follower_count / following_count
+считаются при генерации и согласованы с данными.
+
+Пользователи получают ключи вида gen-key-<id>, по ним нагрузочный тест
+(scripts/bench_routes.py) выбирает клиентов.
+
+Запуск из корня проекта (нужна настроенная БД из .env с применёнными миграциями):
+
+    PYTHONPATH=.:app python -m scripts.generate_social_graph --users 10000 --seed 1
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+
+from app.config import settings
+from app import timeline
+
+
+PLACEHOLDER_MEDIA = b"\x89PNG\r\n\x1a\n" + b"\x00" * 4088
+
+
+def zipf_weights(n: int, exponent: float):
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+def sample_distinct(rng: random.Random, population: list, cum_weights: list, k: int, exclude: int) -> set:
+    chosen = set()
+    total = cum_weights[-1]
+    attempts = 0
+    while len(chosen) < k and attempts < k * 10:
+        attempts += 1
+        candidate = population[bisect.bisect(cum_weights, rng.random() * total)]
+        if candidate != exclude:
+            chosen.add(candidate)
+    return chosen
+
+
+def tweet_text(rng: random.Random, vocabulary_weights: list) -> str:
+    ranks = rng.choices(range(1, len(vocabulary_weights) + 1), cum_weights=vocabulary_weights, k=rng.randint(3, 20))
+    return " ".join(f"word{rank}" for rank in ranks)
+
+
+def generate(args, first_user_id: int, first_tweet_id: int, first_media_id: int, media_path: str):
+    rng = random.Random(args.seed)
+    vocabulary_weights = zipf_weights(args.vocabulary, 1.0)
+    user_ids = list(range(first_user_id, first_user_id + args.users))
+
+    # Ранг популярности не совпадает с id, иначе знаменитости были бы первыми по порядку
+    by_popularity = user_ids[:]
+    rng.shuffle(by_popularity)
+    popularity_rank = {user_id: rank for rank, user_id in enumerate(by_popularity, start=1)}
+    cum_weights = zipf_weights(args.users, args.zipf_exponent)
+
+    follows = []
+    follower_count = dict.fromkeys(user_ids, 0)
+    following_count = dict.fromkeys(user_ids, 0)
+    for user_id in user_ids:
+        k = min(int(rng.expovariate(1 / args.mean_following)) + 1, args.users - 1)
+        for following_id in sample_distinct(rng, by_popularity, cum_weights, k, user_id):
+            follows.append((user_id, following_id))
+            follower_count[following_id] += 1
+            following_count[user_id] += 1
+
+    now = datetime.now(timezone.utc)
+    tweets, likes, media, tweet_media = [], [], [], []
+    tweet_id, media_id = first_tweet_id, first_media_id
+    for user_id in user_ids:
+        for _ in range(int(rng.expovariate(1 / args.mean_tweets))):
+            created_at = now - timedelta(seconds=rng.uniform(0, args.days * 86400))
+
+            # Вирусность: хвост Парето, усиленный популярностью автора
+            boost = (args.users / popularity_rank[user_id]) ** 0.5
+            like_count = min(int((rng.paretovariate(args.likes_alpha) - 1) * args.mean_likes * boost), args.users)
+            for liker in rng.sample(user_ids, like_count):
+                likes.append((liker, tweet_id))
+
+            for _ in range(rng.choices((0, 1, 2, 4), weights=(70, 20, 7, 3))[0]):
+                media.append((media_id, media_path, len(PLACEHOLDER_MEDIA)))
+                tweet_media.append((tweet_id, media_id))
+                media_id += 1
+
+            tweets.append((tweet_id, user_id, tweet_text(rng, vocabulary_weights), like_count, created_at, created_at))
+            tweet_id += 1
+
+    users = [
+        (user_id, f"user{user_id}", f"gen-key-{user_id}", follower_count[user_id], following_count[user_id])
+        for user_id in user_ids
+    ]
+    return users, follows, tweets, likes, media, tweet_media
+
+
+async def main(args):
+    dsn = str(settings.SQLALCHEMY_DATABASE_URI).replace("postgresql+asyncpg://", "postgresql://")
+    conn = await asyncpg.connect(dsn)
+    try:
+        first_user_id = await conn.fetchval('SELECT coalesce(max(id), 0) + 1 FROM "user"')
+        first_tweet_id = await conn.fetchval("SELECT coalesce(max(id), 0) + 1 FROM tweet")
+        first_media_id = await conn.fetchval("SELECT coalesce(max(id), 0) + 1 FROM media")
+
+        media_path = os.path.join(settings.OUT_FILE_PATH, "synthetic.png")
+        with open(media_path, "wb") as f:
+            f.write(PLACEHOLDER_MEDIA)
+
+        started = time.perf_counter()
+        users, follows, tweets, likes, media, tweet_media = generate(
+            args, first_user_id, first_tweet_id, first_media_id, media_path
+        )
+        print(f"generated in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        async with conn.transaction():
+            await conn.copy_records_to_table(
+                "user", records=users, columns=["id", "username", "key", "follower_count", "following_count"]
+            )
+            await conn.copy_records_to_table("user_following", records=follows, columns=["user_id", "following_id"])
+            await conn.copy_records_to_table(
+                "tweet", records=tweets, columns=["id", "user_id", "post", "like_count", "created_at", "updated_at"]
+            )
+            await conn.copy_records_to_table("favorite", records=likes, columns=["user_id", "tweet_id"])
+            await conn.copy_records_to_table("media", records=media, columns=["id", "path", "size"])
+            await conn.copy_records_to_table("tweet_media", records=tweet_media, columns=["tweet_id", "media_id"])
+
+            if args.timeline:
+                await conn.execute(
+                    """
+                    INSERT INTO timeline (user_id, tweet_id, created_at)
+                    SELECT uf.user_id, t.id, t.created_at
+                    FROM user_following uf
+                    JOIN tweet t ON t.user_id = uf.following_id
+                    JOIN "user" a ON a.id = t.user_id
+                    WHERE t.id >= $1 AND a.follower_count <= $2
+                    ON CONFLICT DO NOTHING
+                    """,
+                    first_tweet_id,
+                    settings.TIMELINE_FANOUT_MAX_FOLLOWERS,
+                )
+
+            for table in ("user", "tweet", "media"):
+                await conn.execute(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"
+                )
+
+        await conn.execute('ANALYZE "user", user_following, tweet, favorite, media, tweet_media, timeline')
+        print(f"loaded in {time.perf_counter() - started:.1f}s")
+    finally:
+        await conn.close()
+
+    top = sorted(users, key=lambda user: user[3], reverse=True)[:3]
+    max_likes = max((tweet[3] for tweet in tweets), default=0)
+    print(
+        f"users={len(users)} follows={len(follows)} tweets={len(tweets)} likes={len(likes)} media={len(media)}\n"
+        f"top followers: {', '.join(f'{user[1]}={user[3]}' for user in top)}; max likes on a tweet: {max_likes}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--mean-following", type=float, default=50, help="среднее число подписок пользователя")
+    parser.add_argument("--zipf-exponent", type=float, default=1.1, help="показатель s распределения популярности")
+    parser.add_argument("--mean-tweets", type=float, default=10, help="среднее число твитов пользователя")
+    parser.add_argument("--mean-likes", type=float, default=2, help="масштаб распределения лайков")
+    parser.add_argument("--likes-alpha", type=float, default=1.5, help="параметр Парето: меньше - тяжелее хвост")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="размер словаря текстов твитов")
+    parser.add_argument("--days", type=float, default=30, help="за сколько дней разбросаны твиты")
+    parser.add_argument(
+        "--timeline", action="store_true", default=timeline.is_push_mode(),
+        help="заполнить таблицу timeline (по умолчанию - если TIMELINE_MODE=push)"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
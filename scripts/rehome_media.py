@@ -0,0 +1,123 @@
+"""
+Перенос медиа, загруженных до перехода на хранилище с ключами, в раскладку ab/cd/<sha256>.<ext>.
+
+Медиа обходятся пачками по id. Для каждого файла со старым (абсолютным) путём считается
+SHA-256, если его ещё нет, копия сохраняется в текущее хранилище (MEDIA_STORAGE),
+Media.path переписывается на ключ. Старые файлы удаляются только после фиксации пачки,
+поэтому прерванный перенос можно просто запустить снова.
+
+Файлы, содержимое которых совпадает с уже загруженным медиа (sha256 уникален), не
+переносятся и перечисляются в отчёте.
+
+Запуск из корня проекта:
+
+    PYTHONPATH=.:app python -m scripts.rehome_media --dry-run
+    PYTHONPATH=.:app python -m scripts.rehome_media --batch-size 500
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+from typing import List, Optional, Tuple
+
+from aiofiles import open as async_open
+from sqlalchemy import update
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.db.session import async_session
+from app.storage import is_sharded_key, media_key, storage
+
+
+async def file_sha256(path: str) -> Tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    async with async_open(path, "rb") as f:
+        while chunk := await f.read(settings.MEDIA_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+async def rehome_batch(session, rows, dry_run: bool) -> Tuple[int, List[str], List[str]]:
+    """
+    Перенос одной пачки; возвращает число перенесённых медиа, старые пути
+    (удаляются после фиксации) и сообщения о пропущенных медиа.
+    """
+
+    moved, old_paths, skipped = 0, [], []
+    for media_id, path, sha256, size in rows:
+        if is_sharded_key(path):
+            continue
+        if not os.path.isfile(path):
+            skipped.append(f"media {media_id}: file {path} is missing")
+            continue
+
+        if sha256 is None:
+            sha256, size = await file_sha256(path)
+            duplicate = await session.scalar(select(models.Media.id).filter_by(sha256=sha256))
+            if duplicate is not None:
+                skipped.append(f"media {media_id}: same content as media {duplicate}, left in place")
+                continue
+
+        key = media_key(sha256, os.path.splitext(path)[1].lstrip("."))
+        if not dry_run:
+            await storage.put(path, key)
+            await session.execute(
+                update(models.Media)
+                .where(models.Media.id == media_id)
+                .values(path=key, sha256=sha256, size=size)
+                .execution_options(synchronize_session=False)
+            )
+        moved += 1
+        old_paths.append(path)
+
+    return moved, old_paths, skipped
+
+
+async def main(batch_size: int, dry_run: bool, limit: Optional[int]):
+    await storage.start()
+    moved_total, after_id = 0, 0
+    try:
+        while limit is None or moved_total < limit:
+            async with async_session() as session:
+                stmt = (
+                    select(models.Media.id, models.Media.path, models.Media.sha256, models.Media.size)
+                    .where(models.Media.id > after_id, models.Media.path.like("/%"))
+                    .order_by(models.Media.id)
+                    .limit(batch_size)
+                )
+                rows = (await session.execute(stmt)).all()
+                if not rows:
+                    break
+                after_id = rows[-1].id
+
+                moved, old_paths, skipped = await rehome_batch(session, rows, dry_run)
+                await session.commit()
+
+                if not dry_run:
+                    # Старый файл может остаться нужен пропущенным медиа с тем же путём
+                    still_used = set(
+                        (await session.execute(select(models.Media.path).where(models.Media.path.in_(old_paths))))
+                        .scalars()
+                        .all()
+                    )
+                    for path in set(old_paths) - still_used:
+                        os.remove(path)
+
+            moved_total += moved
+            for message in skipped:
+                print(message)
+            print(f"{'would move' if dry_run else 'moved'} {moved_total} media (up to id {after_id})")
+    finally:
+        await storage.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=None, help="остановиться после переноса N медиа")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что было бы перенесено")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run, args.limit))